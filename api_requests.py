@@ -0,0 +1,151 @@
+import numpy as np
+from clinical_slots import pose_matrix, select_slots
+from pose_codecs import json_pose, pose_rows, single_pose
+from triage import triage, triage_dicts
+
+# Request parsing, validation and response bodies shared by the Flask app
+# (app.py) and the ASGI app (asgi.py). Each app only reads bodies, headers
+# and query parameters its own way and hands them to these functions, which
+# raise ValueError for bad input; both apps answer that with a 400.
+
+ENDPOINTS = {
+    "health": "/health",
+    "ready": "/ready",
+    "model": "/model",
+    "predict": "/predict (POST)",
+    "batch_predict": "/batch_predict (POST)",
+    "triage": "/triage (POST)",
+    "fhir_observation": "/fhir/observation (POST)",
+    "fhir_bundle": "/fhir/bundle (POST)",
+    "predict_sequence": "/predict_sequence (POST)",
+    "stream_predict": "/stream_predict (POST, NDJSON or float32 rows)",
+    "cache_stats": "/cache/stats",
+    "batching_stats": "/batching/stats"
+}
+
+def pose_request(poses, data):
+    """(pose_features, JSON body or None) of a /predict-style request
+
+    `poses` is the decoded binary body, or None for a JSON body `data`.
+    """
+    if poses is not None:
+        return single_pose(poses), None
+    if not data or 'pose_features' not in data:
+        raise ValueError("No pose_features provided")
+    # Converted up front, so a malformed pose never reaches a shared batch
+    return json_pose(data['pose_features']), data
+
+def pose_list_request(poses, data):
+    """(pose_list, JSON body or None) of a /batch_predict-style request
+
+    JSON poses come back as an (N, 225) float32 matrix, converted before any
+    scoring so that streamed responses never fail after they have started.
+    """
+    if poses is not None:
+        return pose_rows(poses), None
+    if not data or 'pose_list' not in data:
+        raise ValueError("No pose_list provided")
+    pose_list = data['pose_list']
+    if not isinstance(pose_list, list) or not all(isinstance(pose, list) for pose in pose_list):
+        raise ValueError("pose_list must be a list of pose arrays")
+    try:
+        poses = np.asarray(pose_list, dtype=np.float32)
+    except (TypeError, ValueError):
+        poses = None  # ragged rows, checked one by one below
+    if poses is None or poses.ndim != 2:
+        try:
+            poses = [json_pose(pose) for pose in pose_list]
+        except ValueError:
+            raise ValueError("pose_list must be a list of 1-D number arrays") from None
+    return pose_matrix(poses), data
+
+def slots_request(data, query_slots=None):
+    """Slot selection from a JSON body's "slots" or a ?slots=a,b query value
+
+    The query parameter serves binary and streamed bodies. Returns None for
+    every slot and raises ValueError for unknown slot names.
+    """
+    if data and 'slots' in data:
+        return select_slots(data['slots'])
+    return select_slots(query_slots)
+
+def patient_ids_request(data, count):
+    """A JSON body's optional "patient_ids", one per pose"""
+    patient_ids = (data or {}).get('patient_ids')
+    if patient_ids is None:
+        return None
+    if not isinstance(patient_ids, list):
+        raise ValueError("patient_ids must be a list")
+    if len(patient_ids) != count:
+        raise ValueError(f"got {len(patient_ids)} patient_ids for {count} poses")
+    return patient_ids
+
+def sequence_request(data):
+    """(clips, window_edges) of a /predict_sequence body"""
+    if not data or ('frames' not in data and 'clips' not in data):
+        raise ValueError("No frames or clips provided")
+    try:
+        window_edges = int(data.get('window_edges', 1))
+    except (TypeError, ValueError):
+        raise ValueError("window_edges must be an integer") from None
+    clips = data['clips'] if 'clips' in data else [data['frames']]
+
+    # Validate input
+    if not isinstance(clips, list) or not all(
+            isinstance(frames, list) and all(isinstance(frame, list) for frame in frames) for frames in clips):
+        raise ValueError("frames must be a 2D array of [frame][feature]")
+    return clips, window_edges
+
+def triage_request(data):
+    """The already-scored per-patient predictions of a /triage body"""
+    if not data or not isinstance(data.get('predictions'), list):
+        raise ValueError("No predictions provided")
+    return data['predictions']
+
+def predict_response(results, slots, version):
+    return {
+        "status": "success",
+        "predictions": results,
+        # Triage weighs every slot, so it is left out for slot subsets
+        "triage": triage_dicts([results]).to_dicts()[0] if slots is None else None,
+        "model_accuracy": "86.7%",
+        "model_version": version
+    }
+
+def batch_response(predictions, slots, version):
+    response = {
+        "status": "success",
+        "predictions": predictions.to_dicts(),
+        "count": len(predictions),
+        "model_version": version
+    }
+    if slots is None:
+        # Priority per patient plus the most-urgent-first order
+        triaged = triage(predictions)
+        response.update(triage=triaged.to_dicts(), ranking=triaged.ranking())
+    return response
+
+def triage_response(results):
+    triaged = triage_dicts(results)
+    return {
+        "status": "success",
+        "triage": triaged.to_dicts(),
+        "ranking": triaged.ranking(),
+        "count": len(triaged)
+    }
+
+def sequence_response(results, data, clips, version):
+    if 'clips' in data:
+        return {
+            "status": "success",
+            "predictions": results,
+            "count": len(results),
+            "model_version": version
+        }
+    return {
+        "status": "success",
+        "predictions": results[0],
+        "frame_count": len(clips[0]),
+        "model_accuracy": "86.7%",
+        "model_version": version
+    }
@@ -1,76 +1,543 @@
-from flask import Flask, request, jsonify
-from clinical_gat_inference import ClinicalGATInference
-import numpy as np
+import time
+APP_START = time.perf_counter()
+
 import os
 
+# Under the pre-forking gunicorn config (gunicorn.conf.py) the master loads
+# and warms the model on a single thread, so no intra-op pool exists at fork
+# time; each worker sizes its own pool in post_fork. Set before anything
+# imports numpy or torch, whose BLAS/OpenMP libraries read these once at load.
+PREFORK = os.environ.get('CLINICAL_GAT_PREFORK') == '1'
+if PREFORK:
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = '1'
+
+from flask import Flask, Response, request, jsonify, stream_with_context
+import functools
+import importlib
+import importlib.util
+import json
+import numpy as np
+import threading
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from api_requests import (ENDPOINTS, batch_response, patient_ids_request, pose_list_request, pose_request,
+                          predict_response, sequence_request, sequence_response, slots_request,
+                          triage_request, triage_response)
+from clinical_slots import build_once, finite_smoke_test, remove_stale_artifacts, weights_version
+from fhir import FHIR_JSON, bundle, ndjson_observations, observation
+from pose_codecs import PoseStreamDecoder, STREAM_TYPES, decode_poses, is_binary, ndjson_predictions
+
 app = Flask(__name__)
 
-# Initialize model
+def load_engine(backend=None, weights_path=None):
+    """Load the inference engine selected by CLINICAL_GAT_BACKEND
+    
+    torch (default) and onnxruntime go through ClinicalGATInference, which
+    exports and parity-checks the ONNX graph. numpy serves from a converted
+    .npz archive without importing torch. Artifacts derived from a .pth are
+    named after its content hash, so a stale conversion is never served
+    under new weights. Without the .pth (a torch-free image), numpy and
+    onnxruntime serve the shipped .npz/.onnx file, versioned by its own hash.
+    CLINICAL_GAT_WEIGHTS may point at a memory-mapped .safetensors file so
+    that all workers share one copy of the weights.
+    """
+    backend = backend or os.environ.get('CLINICAL_GAT_BACKEND', 'torch')
+    weights_path = weights_path or os.environ.get('CLINICAL_GAT_WEIGHTS', 'clinical_gat_weights.pth')
+    stem = os.path.splitext(weights_path)[0]
+    have_weights = os.path.exists(weights_path)
+    
+    if backend == 'numpy':
+        from clinical_gat_numpy import NumpyClinicalGAT, convert_weights
+        npz_path = os.environ.get('CLINICAL_GAT_NPZ')
+        if npz_path or not weights_path.endswith('.pth'):
+            return NumpyClinicalGAT(npz_path or weights_path)
+        if not have_weights:
+            return NumpyClinicalGAT(stem + '.npz')
+        version = weights_version(weights_path)
+        engine = NumpyClinicalGAT(build_once(f"{stem}.{version}.npz",
+                                             lambda path: convert_weights(weights_path, path)))
+        engine.version = version  # versioned by the source weights, as reload() does
+        return engine
+    
+    onnx_path = os.environ.get('CLINICAL_GAT_ONNX')
+    if backend == 'onnxruntime' and importlib.util.find_spec('torch') is None:
+        # No torch to export or parity-check with: serve the shipped graph
+        from clinical_gat_onnx import OnnxClinicalGAT
+        engine = OnnxClinicalGAT(onnx_path or stem + '.onnx')
+        finite_smoke_test(engine)
+        return engine
+    
+    from clinical_gat_inference import ClinicalGATInference
+    return ClinicalGATInference(weights_path, backend=backend, onnx_path=onnx_path)
+
+# Modules whose import load_engine() pays for, timed separately at startup
+BACKEND_MODULES = {
+    'torch': ('clinical_gat_inference',),
+    'onnxruntime': ('onnxruntime', 'clinical_gat_onnx'),
+    'numpy': ('clinical_gat_numpy',),
+}
+
+# Batch sizes run once before the process reports ready
+WARMUP_BATCH_SIZES = [int(size) for size in os.environ.get('WARMUP_BATCH_SIZES', '1,8,64,256').split(',')]
+
+def warm_up(engine, batch_sizes=(1, 8, 64)):
+    """Run representative batch sizes once so lazy initialization happens now"""
+    for size in batch_sizes:
+        engine.predict_batch(np.zeros((size, 225), dtype=np.float32))
+
+def set_inference_threads(num_threads):
+    """Size this process's inference thread pool (called per worker after fork)
+    
+    The new pool is warmed up before the worker takes traffic.
+    """
+    start = time.perf_counter()
+    engine.set_num_threads(num_threads)
+    warm_up(engine, WARMUP_BATCH_SIZES)
+    startup['timings']['worker_warm_up_s'] = round(time.perf_counter() - start, 3)
+    start_weight_watcher()
+
+engine = None
+startup = {'status': 'loading', 'error': None, 'timings': {}}
+ready = threading.Event()
+
+def start_model():
+    """Import, load and warm up the engine, recording how long each phase takes"""
+    global engine
+    timings = startup['timings']
+    timings['app_import_s'] = round(time.perf_counter() - APP_START, 3)
+    try:
+        backend = os.environ.get('CLINICAL_GAT_BACKEND', 'torch')
+        phase = time.perf_counter()
+        for module in BACKEND_MODULES.get(backend, ()):
+            importlib.import_module(module)
+        timings['backend_import_s'] = round(time.perf_counter() - phase, 3)
+        
+        phase = time.perf_counter()
+        loaded = load_engine(backend)
+        if PREFORK:
+            loaded.set_num_threads(1)
+        timings['weight_load_s'] = round(time.perf_counter() - phase, 3)
+        
+        phase = time.perf_counter()
+        warm_up(loaded, WARMUP_BATCH_SIZES)
+        timings['warm_up_s'] = round(time.perf_counter() - phase, 3)
+        timings['total_s'] = round(time.perf_counter() - APP_START, 3)
+    except Exception as e:
+        startup.update(status='failed', error=str(e))
+        print(f"❌ Model failed to load: {e}")
+        return
+    
+    engine = loaded
+    startup['status'] = 'ready'
+    ready.set()
+    if not PREFORK:
+        start_weight_watcher()
+    print("✅ Model loaded successfully!")
+    print(f"⏱️ Startup: app import {timings['app_import_s']}s, {backend} import {timings['backend_import_s']}s, "
+          f"weight load {timings['weight_load_s']}s, warm-up {timings['warm_up_s']}s "
+          f"(total {timings['total_s']}s)")
+
+WEIGHTS_PATH = os.environ.get('CLINICAL_GAT_WEIGHTS', 'clinical_gat_weights.pth')
+reloads = {'count': 0, 'last_error': None, 'last_reload_s': None}
+reload_lock = threading.Lock()
+
+def reload_model(weights_path=None):
+    """Load, verify and atomically swap in new weights without stopping traffic
+    
+    The new engine is built beside the serving one; requests that already
+    hold the old engine finish on it. Returns True if a new version was
+    swapped in; on failure the old model keeps serving.
+    """
+    global engine
+    with reload_lock:
+        current = engine
+        if not hasattr(current, 'reload'):
+            reloads['last_error'] = f"{type(current).__name__} does not support hot reload"
+            return False
+        start = time.perf_counter()
+        try:
+            loaded = current.reload(weights_path or WEIGHTS_PATH)
+            warm_up(loaded, WARMUP_BATCH_SIZES)
+        except Exception as e:
+            reloads['last_error'] = str(e)
+            print(f"❌ Reload rejected, still serving {current.version}: {e}")
+            return False
+        engine = loaded
+        if cache is not None:
+            cache.clear()
+        reloads.update(count=reloads['count'] + 1, last_error=None,
+                       last_reload_s=round(time.perf_counter() - start, 3))
+        print(f"🔄 Model {current.version} -> {loaded.version} in {reloads['last_reload_s']}s")
+        # Earlier versions' .npz/.onnx files are not needed once the new engine serves
+        try:
+            removed = remove_stale_artifacts(weights_path or WEIGHTS_PATH, loaded.version)
+        except OSError as e:
+            print(f"⚠️ Could not remove stale model artifacts: {e}")
+        else:
+            if removed:
+                print(f"🧹 Removed {len(removed)} stale model artifact(s)")
+        return True
+
+def watch_weights(interval):
+    """Reload whenever the weight file's contents change (replace it atomically to deploy)"""
+    last_seen = None
+    while True:
+        time.sleep(interval)
+        try:
+            stat = os.stat(WEIGHTS_PATH)
+        except OSError:
+            continue
+        if (stat.st_mtime_ns, stat.st_size) != last_seen:
+            last_seen = (stat.st_mtime_ns, stat.st_size)
+            if weights_version(WEIGHTS_PATH) != engine.version:
+                reload_model()
+
+watcher_pid = None
+
+def start_weight_watcher():
+    """Per-process watcher thread, enabled by CLINICAL_GAT_RELOAD_INTERVAL seconds"""
+    global watcher_pid
+    interval = float(os.environ.get('CLINICAL_GAT_RELOAD_INTERVAL', 0))
+    if interval <= 0 or watcher_pid == os.getpid() or not hasattr(engine, 'reload'):
+        return
+    watcher_pid = os.getpid()
+    threading.Thread(target=watch_weights, args=(interval,), name='weight-watcher', daemon=True).start()
+
+# Initialize model. The pre-fork master loads before forking; a standalone
+# process serves /health and /ready while the model loads in the background
 print("🚀 Loading Clinical GAT Model...")
-engine = ClinicalGATInference('clinical_gat_weights.pth')
-print("✅ Model loaded successfully!")
+if PREFORK or os.environ.get('CLINICAL_GAT_BACKGROUND_LOAD', '1') != '1':
+    start_model()
+else:
+    threading.Thread(target=start_model, name='model-loader', daemon=True).start()
 
-@app.route('/')
-def home():
-    return jsonify({
+def requires_model(view):
+    """Answer 503 with Retry-After until the model has loaded and warmed up"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ready.is_set():
+            return jsonify({"error": "Model is not ready", "status": startup['status']}), 503, {'Retry-After': '5'}
+        return view(*args, **kwargs)
+    return wrapper
+
+def load_cache():
+    """Optional near-duplicate pose cache, enabled by PREDICTION_CACHE_TOLERANCE"""
+    tolerance = os.environ.get('PREDICTION_CACHE_TOLERANCE')
+    if tolerance is None:
+        return None
+    from prediction_cache import PredictionCache
+    return PredictionCache(
+        tolerance=float(tolerance),
+        max_entries=int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', 10000)),
+        ttl_seconds=float(os.environ.get('PREDICTION_CACHE_TTL', 300)),
+        max_bytes=int(float(os.environ.get('PREDICTION_CACHE_MAX_MB', 64)) * 2**20),
+    )
+
+cache = load_cache()
+
+# Poses scored per forward pass by /stream_predict
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 256))
+
+# Largest request body read into memory at once (/stream_predict is unbounded)
+MAX_BODY_BYTES = int(float(os.environ.get('MAX_BODY_MB', 64)) * 2**20)
+
+def load_batcher():
+    """Optional micro-batching scheduler, enabled by MICRO_BATCH_MAX_SIZE > 1
+    
+    Concurrent /predict calls (gunicorn threads) are queued and merged into a
+    single predict_batch forward on one inference thread.
+    """
+    max_batch_size = int(os.environ.get('MICRO_BATCH_MAX_SIZE', 1))
+    if max_batch_size <= 1:
+        return None
+    from micro_batching import MicroBatcher
+    return MicroBatcher(versioned_predict_batch, max_batch_size=max_batch_size,
+                        max_wait_ms=float(os.environ.get('MICRO_BATCH_MAX_WAIT_MS', 2)))
+
+def versioned_predict_batch(pose_list):
+    """(results, model_version) per pose from whichever engine is current"""
+    current = engine
+    return [(results, current.version) for results in current.predict_batch(pose_list)]
+
+batcher = load_batcher()
+
+def only_slots(results, slots):
+    """One pose's result dict narrowed to `slots` (None keeps every slot)"""
+    if slots is None:
+        return results
+    return {slot: results[slot] for slot in slots}
+
+def cache_namespace(version, slots):
+    """Cache namespace for a model version and slot selection"""
+    return version if slots is None else f"{version}:{','.join(slots)}"
+
+def predict_one(pose_features, slots=None):
+    """(results, model_version) for one pose, shared with concurrent requests when batching
+    
+    Batched requests run every head so they can share one forward pass;
+    their results are narrowed to `slots` afterwards.
+    """
+    if batcher is not None:
+        results, version = batcher.predict(pose_features)
+        return only_slots(results, slots), version
+    current = engine
+    return current.predict(pose_features, slots), current.version
+
+def predict_cached(pose_features, slots=None):
+    """predict_one, reusing results for near-identical poses on the same model version"""
+    if cache is None:
+        return predict_one(pose_features, slots)
+    return cache.get_or_compute(pose_features, lambda pose: predict_one(pose, slots),
+                                cache_namespace(engine.version, slots))
+
+def check_body_size(size):
+    if size > MAX_BODY_BYTES:
+        raise RequestEntityTooLarge(f"request body exceeds MAX_BODY_MB ({MAX_BODY_BYTES} bytes)")
+
+def read_body():
+    """Request body read straight into a writable bytearray; 413 past MAX_BODY_BYTES"""
+    if request.content_length is None:
+        body = bytearray(request.stream.read(MAX_BODY_BYTES + 1))
+        check_body_size(len(body))
+        return body
+    # Checked before allocating, so a forged Content-Length costs nothing
+    check_body_size(request.content_length)
+    body = bytearray(request.content_length)
+    view, filled = memoryview(body), 0
+    while filled < len(body):
+        read = request.stream.readinto(view[filled:])
+        if not read:
+            raise ValueError("request body ended early")
+        filled += read
+    return body
+
+def request_poses(key):
+    """Pose array from a binary (octet-stream, .npy, msgpack) body, or None for JSON
+    
+    Raw float32 bodies are rows of X-Pose-Width features (default 225).
+    """
+    if not is_binary(request.mimetype):
+        return None
+    width = int(request.headers.get('X-Pose-Width', 225))
+    return decode_poses(read_body(), request.mimetype, key, width)
+
+def request_json():
+    """The parsed JSON body; 413 past MAX_BODY_BYTES"""
+    check_body_size(request.content_length or 0)
+    return request.json
+
+def request_pose():
+    """(pose_features, JSON body or None) of a /predict-style request; raises ValueError"""
+    poses = request_poses('pose_features')
+    return pose_request(poses, request_json() if poses is None else None)
+
+def request_pose_list():
+    """(pose_list, JSON body or None) of a /batch_predict-style request; raises ValueError"""
+    poses = request_poses('pose_list')
+    return pose_list_request(poses, request_json() if poses is None else None)
+
+def request_slots(data=None):
+    """Slot selection from a JSON body's "slots" or a ?slots=a,b query parameter"""
+    return slots_request(data, request.args.get('slots'))
+
+# Status payloads and codes shared with the ASGI app
+def home_status():
+    return {
         "message": "Clinical GAT API - Ugandan Sign Language Healthcare",
-        "status": "healthy",
+        "status": "healthy" if ready.is_set() else startup['status'],
         "accuracy": "86.7%",
-        "endpoints": {
-            "health": "/health",
-            "predict": "/predict (POST)"
-        }
-    })
+        "endpoints": ENDPOINTS
+    }, 200
+
+def health_status():
+    # Liveness: only a failed load is unhealthy, but a loading process says so
+    if startup['status'] == 'failed':
+        return {"status": "failed", "error": startup['error']}, 503
+    if not ready.is_set():
+        return {"status": "loading", "model": "Clinical GAT 86.7%"}, 200
+    return {"status": "healthy", "model": "Clinical GAT 86.7%"}, 200
+
+def readiness_status():
+    # Readiness: 200 only once the model is loaded and warmed up
+    if not ready.is_set():
+        return {"status": startup['status'], "error": startup['error']}, 503
+    return {"status": "ready", "model_version": engine.version, "startup": startup['timings']}, 200
+
+def model_status():
+    if not ready.is_set():
+        return {"status": startup['status']}, 503
+    return {
+        "model_version": engine.version,
+        "weights": WEIGHTS_PATH,
+        "engine": type(engine).__name__,
+        "reloads": reloads
+    }, 200
+
+def cache_status():
+    if cache is None:
+        return {"enabled": False}, 200
+    return {"enabled": True, **cache.stats()}, 200
+
+def batching_status():
+    if batcher is None:
+        return {"enabled": False}, 200
+    return {"enabled": True, **batcher.stats()}, 200
+
+@app.errorhandler(ValueError)
+def bad_request(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.errorhandler(HTTPException)
+def http_error(e):
+    return jsonify({"error": e.description}), e.code
+
+@app.errorhandler(Exception)
+def server_error(e):
+    return jsonify({"error": str(e)}), 500
+
+@app.route('/')
+def home():
+    payload, status = home_status()
+    return jsonify(payload), status
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "healthy", "model": "Clinical GAT 86.7%"})
+    payload, status = health_status()
+    return jsonify(payload), status
+
+@app.route('/ready')
+def readiness():
+    payload, status = readiness_status()
+    return jsonify(payload), status
+
+@app.route('/model')
+def model_info():
+    payload, status = model_status()
+    return jsonify(payload), status
+
+@app.route('/cache/stats')
+def cache_stats():
+    payload, status = cache_status()
+    return jsonify(payload), status
+
+@app.route('/batching/stats')
+def batching_stats():
+    payload, status = batching_status()
+    return jsonify(payload), status
 
 @app.route('/predict', methods=['POST'])
+@requires_model
 def predict():
-    try:
-        data = request.json
-        
-        if not data or 'pose_features' not in data:
-            return jsonify({"error": "No pose_features provided"}), 400
-        
-        pose_features = np.array(data['pose_features'])
-        
-        # Validate input
-        if len(pose_features.shape) != 1:
-            return jsonify({"error": "pose_features must be 1D array"}), 400
-        
-        # Get predictions
-        results = engine.predict(pose_features)
-        
-        return jsonify({
-            "status": "success",
-            "predictions": results,
-            "model_accuracy": "86.7%"
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    pose_features, data = request_pose()
+    
+    # Get predictions, reusing results for near-identical poses and
+    # sharing a forward pass with concurrent requests when batching
+    slots = request_slots(data)
+    results, version = predict_cached(pose_features, slots)
+    return jsonify(predict_response(results, slots, version))
 
 @app.route('/batch_predict', methods=['POST'])
+@requires_model
 def batch_predict():
-    try:
-        data = request.json
-        
-        if not data or 'pose_list' not in data:
-            return jsonify({"error": "No pose_list provided"}), 400
-        
-        pose_list = [np.array(pose) for pose in data['pose_list']]
-        results = [engine.predict(pose) for pose in pose_list]
-        
-        return jsonify({
-            "status": "success",
-            "predictions": results,
-            "count": len(results)
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    pose_list, data = request_pose_list()
+    
+    # Score every pose in one batched forward pass
+    current = engine
+    slots = request_slots(data)
+    predictions = current.predict_compact(pose_list, slots)
+    return jsonify(batch_response(predictions, slots, current.version))
+
+@app.route('/fhir/observation', methods=['POST'])
+@requires_model
+def fhir_observation():
+    """Score one pose (a /predict body plus optional patient_id) as a FHIR R4 Observation"""
+    pose_features, data = request_pose()
+    results, version = predict_cached(pose_features, request_slots(data))
+    patient_id = (data or {}).get('patient_id') or request.args.get('patient_id')
+    return Response(observation(results, patient_id, version), mimetype=FHIR_JSON)
+
+@app.route('/fhir/bundle', methods=['POST'])
+@requires_model
+def fhir_bundle():
+    """Score a /batch_predict body (plus optional patient_ids) as a FHIR R4 collection Bundle
+    
+    The Bundle is scored and sent STREAM_CHUNK_SIZE entries at a time, so
+    the response is never held in memory as a whole.
+    """
+    pose_list, data = request_pose_list()
+    slots = request_slots(data)
+    patient_ids = patient_ids_request(data, len(pose_list))
+    
+    current = engine
+    def batches():
+        for start in range(0, len(pose_list), STREAM_CHUNK_SIZE):
+            end = start + STREAM_CHUNK_SIZE
+            yield (current.predict_compact(pose_list[start:end], slots),
+                   patient_ids[start:end] if patient_ids is not None else None)
+    
+    return Response(stream_with_context(bundle(batches(), current.version)), mimetype=FHIR_JSON)
+
+@app.route('/triage', methods=['POST'])
+def triage_predictions():
+    """Re-rank already-scored patients without running the model"""
+    return jsonify(triage_response(triage_request(request_json())))
+
+@app.route('/stream_predict', methods=['POST'])
+@requires_model
+def stream_predict():
+    """Score an NDJSON or raw float32 pose stream chunk by chunk, streaming NDJSON back
+    
+    Memory stays bounded by one chunk however long the request is. Errors
+    after the response has started are reported as a final {"error"} line.
+    With ?format=fhir every line is a FHIR R4 Observation instead, with
+    each NDJSON line's optional "patient_id" as its subject.
+    """
+    if request.mimetype not in STREAM_TYPES:
+        return jsonify({"error": f"Content-Type must be one of {', '.join(STREAM_TYPES)}"}), 415
+    output = request.args.get('format', 'predictions')
+    if output not in ('predictions', 'fhir'):
+        raise ValueError("format must be predictions or fhir")
+    fhir = output == 'fhir'
+    decoder = PoseStreamDecoder(request.mimetype, STREAM_CHUNK_SIZE,
+                                int(request.headers.get('X-Pose-Width', 225)), patient_ids=fhir)
+    slots = request_slots()
+    
+    def generate():
+        # The whole stream is scored by the model version it started on
+        current = engine
+        scored = 0
+        try:
+            while True:
+                data = request.stream.read(65536)
+                batches = decoder.feed(data) if data else decoder.close()
+                for batch in batches:
+                    if fhir:
+                        poses, patient_ids = batch
+                        predictions = current.predict_compact(poses, slots)
+                        yield ndjson_observations(predictions, patient_ids, current.version)
+                    else:
+                        predictions = current.predict_compact(batch, slots)
+                        yield ndjson_predictions(predictions, scored, current.version)
+                    scored += len(predictions)
+                if not data:
+                    return
+        except Exception as e:
+            yield (json.dumps({"error": str(e), "scored": scored}) + '\n').encode('utf-8')
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/predict_sequence', methods=['POST'])
+@requires_model
+def predict_sequence():
+    data = request_json()
+    clips, window_edges = sequence_request(data)
+    current = engine
+    if not hasattr(current, 'predict_sequences'):
+        return jsonify({"error": "Sequence inference is not supported by this backend"}), 501
+    
+    # Score every clip as one temporal graph in a single forward pass
+    results = current.predict_sequences(clips, window_edges, request_slots(data))
+    return jsonify(sequence_response(results, data, clips, current.version))
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import app as api
+from api_requests import (batch_response, patient_ids_request, pose_list_request, pose_request,
+                          predict_response, sequence_request, sequence_response, slots_request,
+                          triage_request, triage_response)
+from fhir import BUNDLE_END, FHIR_JSON, bundle_entries, bundle_start, ndjson_observations, observation, timestamp
+from pose_codecs import PoseStreamDecoder, STREAM_TYPES, decode_poses, is_binary, ndjson_predictions
+
+# ASGI entry point serving the same API as the Flask app, sharing its engine,
+# cache and micro-batcher. Connections are handled on the event loop, so slow
+# clients no longer pin a worker; inference runs on a small thread pool or,
+# when MICRO_BATCH_MAX_SIZE is set, is awaited through the micro-batcher.
+#
+#   uvicorn asgi:app --port 5000
+#   gunicorn --config gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+executor = ThreadPoolExecutor(int(os.environ.get('ASGI_INFERENCE_THREADS', 4)),
+                              thread_name_prefix='inference')
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def error_status(e):
+    """Response status for an exception raised by a handler: bad input (ValueError) is a 400"""
+    if isinstance(e, HTTPError):
+        return e.status
+    return 400 if isinstance(e, ValueError) else 500
+
+async def run_inference(fn, *args):
+    """Run a blocking engine call on the inference pool"""
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+async def predict_one(pose_features, slots=None):
+    """(results, model_version) from api.predict_cached without blocking the event loop"""
+    if api.batcher is None:
+        return await run_inference(api.predict_cached, pose_features, slots)
+
+    key = (api.cache.key(pose_features, api.cache_namespace(api.engine.version, slots))
+           if api.cache is not None else None)
+    value = api.cache.get(key) if key is not None else None
+    if value is None:
+        results, version = await asyncio.wrap_future(api.batcher.submit(pose_features))
+        value = api.only_slots(results, slots), version
+        if key is not None:
+            api.cache.put(key, value)
+    return value
+
+async def read_body(receive):
+    """Request body accumulated into a writable bytearray; 413 past MAX_BODY_BYTES"""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError("client disconnected")
+        body += message.get('body', b'')
+        if len(body) > api.MAX_BODY_BYTES:
+            raise HTTPError(413, f"request body exceeds MAX_BODY_MB ({api.MAX_BODY_BYTES} bytes)")
+        if not message.get('more_body'):
+            return body
+
+async def read_json(receive):
+    try:
+        return json.loads(await read_body(receive) or b'null')
+    except ValueError:
+        raise ValueError("Request body must be valid JSON") from None
+
+def header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin1')
+    return None
+
+def content_type(scope):
+    return (header(scope, b'content-type') or '').split(';')[0].strip().lower()
+
+def query_param(scope, name, default=None):
+    query = parse_qs(scope.get('query_string', b'').decode('latin1'))
+    return query[name][-1] if name in query else default
+
+async def read_poses(scope, receive, key):
+    """Pose array from a binary (octet-stream, .npy, msgpack) body, or None for JSON"""
+    mimetype = content_type(scope)
+    if not is_binary(mimetype):
+        return None
+    width = int(header(scope, b'x-pose-width') or 225)
+    return decode_poses(await read_body(receive), mimetype, key, width)
+
+async def read_pose(scope, receive):
+    """(pose_features, JSON body or None) of a /predict-style request"""
+    poses = await read_poses(scope, receive, 'pose_features')
+    return pose_request(poses, await read_json(receive) if poses is None else None)
+
+async def read_pose_list(scope, receive):
+    """(pose_list, JSON body or None) of a /batch_predict-style request"""
+    poses = await read_poses(scope, receive, 'pose_list')
+    return pose_list_request(poses, await read_json(receive) if poses is None else None)
+
+def request_slots(scope, data=None):
+    """Slot selection from a JSON body's "slots" or a ?slots=a,b query parameter"""
+    return slots_request(data, query_param(scope, 'slots'))
+
+async def send_body(send, body, content_type, status=200, headers=()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type),
+                            (b'content-length', str(len(body)).encode()), *headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    await send_body(send, body, b'application/json', status, headers)
+
+async def home(scope, receive):
+    return api.home_status()
+
+async def health(scope, receive):
+    return api.health_status()
+
+async def readiness(scope, receive):
+    return api.readiness_status()
+
+async def model_info(scope, receive):
+    return api.model_status()
+
+async def cache_stats(scope, receive):
+    return api.cache_status()
+
+async def batching_stats(scope, receive):
+    return api.batching_status()
+
+async def predict(scope, receive):
+    pose_features, data = await read_pose(scope, receive)
+    slots = request_slots(scope, data)
+    results, version = await predict_one(pose_features, slots)
+    return predict_response(results, slots, version)
+
+async def batch_predict(scope, receive):
+    pose_list, data = await read_pose_list(scope, receive)
+
+    # Score every pose in one batched forward pass
+    current = api.engine
+    slots = request_slots(scope, data)
+    predictions = await run_inference(current.predict_compact, pose_list, slots)
+    return batch_response(predictions, slots, current.version)
+
+async def triage_predictions(scope, receive):
+    """Re-rank already-scored patients without running the model"""
+    return triage_response(triage_request(await read_json(receive)))
+
+async def predict_sequence(scope, receive):
+    data = await read_json(receive)
+    clips, window_edges = sequence_request(data)
+    current = api.engine
+    if not hasattr(current, 'predict_sequences'):
+        raise HTTPError(501, "Sequence inference is not supported by this backend")
+
+    results = await run_inference(current.predict_sequences, clips, window_edges, request_slots(scope, data))
+    return sequence_response(results, data, clips, current.version)
+
+async def fhir_observation(scope, receive, send):
+    """Score one pose (a /predict body plus optional patient_id) as a FHIR R4 Observation"""
+    pose_features, data = await read_pose(scope, receive)
+    results, version = await predict_one(pose_features, request_slots(scope, data))
+    patient_id = (data or {}).get('patient_id') or query_param(scope, 'patient_id')
+    await send_body(send, observation(results, patient_id, version).encode('utf-8'), FHIR_JSON.encode())
+
+async def fhir_bundle(scope, receive, send):
+    """Score a /batch_predict body (plus optional patient_ids) as a FHIR R4 Bundle, one chunk at a time"""
+    pose_list, data = await read_pose_list(scope, receive)
+    slots = request_slots(scope, data)
+    patient_ids = patient_ids_request(data, len(pose_list))
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', FHIR_JSON.encode())]})
+    current = api.engine
+    effective = timestamp()
+    await send({'type': 'http.response.body', 'body': bundle_start(effective), 'more_body': True})
+    for start in range(0, len(pose_list), api.STREAM_CHUNK_SIZE):
+        end = start + api.STREAM_CHUNK_SIZE
+        predictions = await run_inference(current.predict_compact, pose_list[start:end], slots)
+        ids = patient_ids[start:end] if patient_ids is not None else None
+        await send({'type': 'http.response.body', 'more_body': True,
+                    'body': bundle_entries(predictions, ids, current.version, effective, first=start == 0)})
+    await send({'type': 'http.response.body', 'body': BUNDLE_END})
+
+async def stream_predict(scope, receive, send):
+    """Score an NDJSON or raw float32 pose stream chunk by chunk, streaming NDJSON back
+
+    With ?format=fhir every line is a FHIR R4 Observation instead.
+    """
+    mimetype = content_type(scope)
+    if mimetype not in STREAM_TYPES:
+        raise HTTPError(415, f"Content-Type must be one of {', '.join(STREAM_TYPES)}")
+    output = query_param(scope, 'format', 'predictions')
+    if output not in ('predictions', 'fhir'):
+        raise ValueError("format must be predictions or fhir")
+    fhir = output == 'fhir'
+    decoder = PoseStreamDecoder(mimetype, api.STREAM_CHUNK_SIZE, int(header(scope, b'x-pose-width') or 225),
+                                patient_ids=fhir)
+    slots = request_slots(scope)
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')]})
+    current = api.engine
+    scored = 0
+    try:
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            more_body = message.get('more_body', False)
+            batches = decoder.feed(message.get('body', b''))
+            if not more_body:
+                batches += decoder.close()
+            for batch in batches:
+                if fhir:
+                    poses, patient_ids = batch
+                    predictions = await run_inference(current.predict_compact, poses, slots)
+                    body = ndjson_observations(predictions, patient_ids, current.version)
+                else:
+                    predictions = await run_inference(current.predict_compact, batch, slots)
+                    body = ndjson_predictions(predictions, scored, current.version)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                scored += len(predictions)
+    except Exception as e:
+        error = json.dumps({"error": str(e), "scored": scored}) + '\n'
+        await send({'type': 'http.response.body', 'body': error.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+# Handlers that send their own (streamed) response
+STREAMING_ROUTES = {
+    '/fhir/observation': ('POST', fhir_observation),
+    '/fhir/bundle': ('POST', fhir_bundle),
+    '/stream_predict': ('POST', stream_predict),
+}
+
+ROUTES = {
+    '/': ('GET', home),
+    '/health': ('GET', health),
+    '/ready': ('GET', readiness),
+    '/model': ('GET', model_info),
+    '/cache/stats': ('GET', cache_stats),
+    '/batching/stats': ('GET', batching_stats),
+    '/predict': ('POST', predict),
+    '/batch_predict': ('POST', batch_predict),
+    '/triage': ('POST', triage_predictions),
+    '/predict_sequence': ('POST', predict_sequence),
+}
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if api.batcher is not None:
+                await asyncio.get_running_loop().run_in_executor(None, api.batcher.close)
+            executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    # Every POST route but /triage runs the model, which may still be loading
+    known = scope['path'] in ROUTES or scope['path'] in STREAMING_ROUTES
+    if known and scope['method'] == 'POST' and scope['path'] != '/triage' and not api.ready.is_set():
+        return await send_json(send, {"error": "Model is not ready", "status": api.startup['status']}, 503,
+                               [(b'retry-after', b'5')])
+
+    route = STREAMING_ROUTES.get(scope['path'])
+    if route is not None:
+        if scope['method'] != route[0]:
+            return await send_json(send, {"error": "Method not allowed"}, 405)
+        started = False
+
+        async def tracked_send(message):
+            nonlocal started
+            started = True
+            await send(message)
+
+        try:
+            return await route[1](scope, receive, tracked_send)
+        except ConnectionError:
+            return
+        except Exception as e:
+            if started:
+                # Too late for an error response: leave the body unterminated
+                print(f"❌ {scope['path']} failed mid-response: {e}")
+                return
+            return await send_json(send, {"error": str(e)}, error_status(e))
+
+    route = ROUTES.get(scope['path'])
+    if route is None:
+        return await send_json(send, {"error": "Not found"}, 404)
+    method, handler = route
+    if scope['method'] not in (method, 'HEAD' if method == 'GET' else method):
+        return await send_json(send, {"error": "Method not allowed"}, 405)
+
+    try:
+        payload = await handler(scope, receive)
+    except ConnectionError:
+        return
+    except Exception as e:
+        return await send_json(send, {"error": str(e)}, error_status(e))
+    status = 200
+    if isinstance(payload, tuple):
+        payload, status = payload
+    await send_json(send, payload, status)
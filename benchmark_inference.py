@@ -0,0 +1,156 @@
+import argparse
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from clinical_gat_inference import ClinicalGATInference
+
+def time_call(fn, repeats=50, warmup=5):
+    """Median wall time of fn() in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+def bench_execution_paths(weights_path, batch_sizes, repeats):
+    """Parity and latency of the reference GAT forward against the folded, fused-head path"""
+    reference = ClinicalGATInference(weights_path, folded=False)
+    folded = ClinicalGATInference(weights_path, folded=True)
+
+    print("\n🔬 Parity (folded vs ClinicalGAT.forward)")
+    print(f"   max |diff|: {folded.check_parity():.2e}")
+
+    print("\n⚡ Latency per call (median ms)")
+    print(f"   {'batch':>6} {'reference':>10} {'folded':>10} {'speedup':>8}")
+    rng = np.random.default_rng(0)
+    for size in batch_sizes:
+        poses = rng.uniform(-1, 1, (size, 225)).astype(np.float32)
+        if size == 1:
+            ref_ms = time_call(lambda: reference.predict(poses[0]), repeats)
+            fold_ms = time_call(lambda: folded.predict(poses[0]), repeats)
+        else:
+            ref_ms = time_call(lambda: reference.predict_batch(poses), repeats)
+            fold_ms = time_call(lambda: folded.predict_batch(poses), repeats)
+        print(f"   {size:>6} {ref_ms:>10.3f} {fold_ms:>10.3f} {ref_ms / fold_ms:>7.1f}x")
+
+def bench_onnxruntime(weights_path, onnx_path, batch_sizes, repeats):
+    """Parity and latency of the onnxruntime backend against the torch path"""
+    torch_engine = ClinicalGATInference(weights_path, backend='torch')
+    onnx_engine = ClinicalGATInference(weights_path, backend='onnxruntime', onnx_path=onnx_path)
+    if onnx_engine.backend != 'onnxruntime':
+        print("\n❌ onnxruntime backend failed its parity check")
+        return
+
+    print("\n🔬 Parity (onnxruntime vs ClinicalGAT.forward)")
+    print(f"   max |diff|: {onnx_engine.check_parity():.2e}")
+
+    print("\n⚡ Latency per call (median ms)")
+    print(f"   {'batch':>6} {'torch':>10} {'onnxrt':>10} {'speedup':>8}")
+    rng = np.random.default_rng(0)
+    for size in batch_sizes:
+        poses = rng.uniform(-1, 1, (size, 225)).astype(np.float32)
+        torch_ms = time_call(lambda: torch_engine.predict_batch(poses), repeats)
+        onnx_ms = time_call(lambda: onnx_engine.predict_batch(poses), repeats)
+        print(f"   {size:>6} {torch_ms:>10.3f} {onnx_ms:>10.3f} {torch_ms / onnx_ms:>7.1f}x")
+
+def count_allocations(fn, calls=20):
+    """Average torch tensor allocations/bytes and traced Python/NumPy bytes per call"""
+    from torch.profiler import profile, ProfilerActivity
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        for _ in range(calls):
+            fn()
+    allocations = [event for event in prof.events() if event.self_cpu_memory_usage > 0]
+    tensor_bytes = sum(event.self_cpu_memory_usage for event in allocations)
+
+    tracemalloc.start()
+    for _ in range(calls):
+        fn()
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return len(allocations) / calls, tensor_bytes / calls, python_peak
+
+def bench_allocations(weights_path, batch_sizes):
+    """Steady-state allocations per predict_compact call with and without the buffer pool"""
+    engines = {
+        'fresh': ClinicalGATInference(weights_path, buffer_pool=False),
+        'pooled': ClinicalGATInference(weights_path, buffer_pool=True),
+    }
+
+    print("\n🧮 Allocations per call (steady state)")
+    print(f"   {'batch':>6} {'mode':>7} {'tensors':>8} {'tensor KB':>10} {'py peak KB':>11}")
+    rng = np.random.default_rng(0)
+    for size in batch_sizes:
+        poses = rng.uniform(-1, 1, (size, 225)).astype(np.float32)
+        for mode, engine in engines.items():
+            engine.predict_compact(poses)  # first call fills the pool
+            count, tensor_bytes, python_peak = count_allocations(lambda: engine.predict_compact(poses))
+            print(f"   {size:>6} {mode:>7} {count:>8.1f} {tensor_bytes / 1024:>10.1f} {python_peak / 1024:>11.1f}")
+
+def run_clients(predict, poses, concurrency, requests_per_client):
+    """Call predict(pose) from `concurrency` threads; returns (req/s, p50 ms, p99 ms)"""
+    def client(offset):
+        latencies = []
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            predict(poses[(offset + i) % len(poses)])
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = [ms for batch in pool.map(client, range(concurrency)) for ms in batch]
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def bench_micro_batching(weights_path, settings, concurrency, requests_per_client):
+    """Throughput and latency of concurrent single-pose calls per max_batch_size x max_wait_ms"""
+    from micro_batching import MicroBatcher
+
+    engine = ClinicalGATInference(weights_path)
+    poses = np.random.default_rng(0).uniform(-1, 1, (256, 225)).astype(np.float32)
+
+    print(f"\n🚦 Micro-batching, {concurrency} concurrent callers")
+    print(f"   {'batch':>6} {'wait ms':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+    for setting in settings:
+        max_batch_size, max_wait_ms = setting.split('x')
+        max_batch_size, max_wait_ms = int(max_batch_size), float(max_wait_ms)
+        if max_batch_size <= 1:
+            rps, p50, p99 = run_clients(engine.predict, poses, concurrency, requests_per_client)
+            mean_batch = 1.0
+        else:
+            batcher = MicroBatcher(engine.predict_batch, max_batch_size, max_wait_ms)
+            try:
+                rps, p50, p99 = run_clients(batcher.predict, poses, concurrency, requests_per_client)
+                mean_batch = batcher.stats()['mean_batch_size']
+            finally:
+                batcher.close()
+        print(f"   {max_batch_size:>6} {max_wait_ms:>8.1f} {rps:>8.1f} {p50:>8.2f} {p99:>8.2f} {mean_batch:>11.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clinical GAT inference benchmarks")
+    parser.add_argument('--weights', default='clinical_gat_weights.pth')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64, 200])
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--onnx', metavar='PATH', nargs='?', const='clinical_gat_weights.onnx',
+                        help="also compare the onnxruntime backend (exports the graph if missing)")
+    parser.add_argument('--allocations', action='store_true',
+                        help="also count per-call allocations with and without the buffer pool")
+    parser.add_argument('--micro-batching', metavar='BATCHxWAIT_MS', nargs='*',
+                        help="also load-test concurrent predict() calls per max_batch_size x max_wait_ms "
+                             "(default: 1x0 8x1 32x2 64x5; 1xN means no batcher)")
+    parser.add_argument('--concurrency', type=int, default=32, help="callers for --micro-batching")
+    args = parser.parse_args()
+
+    bench_execution_paths(args.weights, args.batch_sizes, args.repeats)
+    if args.allocations:
+        bench_allocations(args.weights, args.batch_sizes)
+    if args.onnx:
+        bench_onnxruntime(args.weights, args.onnx, args.batch_sizes, args.repeats)
+    if args.micro_batching is not None:
+        bench_micro_batching(args.weights, args.micro_batching or ['1x0', '8x1', '32x2', '64x5'],
+                             args.concurrency, args.repeats)
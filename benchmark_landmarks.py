@@ -0,0 +1,89 @@
+import argparse
+import time
+from landmark_pipeline import POSE_FOUND, HolisticLandmarker, SolutionsLandmarker
+
+class SeparateSolutions:
+    """The desktop client's original set-up: Pose, Hands and FaceMesh each run on the full frame"""
+    def __init__(self, min_detection_confidence=0.7):
+        self.landmarker = SolutionsLandmarker(min_detection_confidence=min_detection_confidence)
+        import mediapipe as mp
+        self.face_mesh = mp.solutions.face_mesh.FaceMesh(min_detection_confidence=min_detection_confidence,
+                                                         min_tracking_confidence=0.5)
+
+    def __call__(self, rgb):
+        self.face_mesh.process(rgb)
+        return self.landmarker(rgb)
+
+    def close(self):
+        self.landmarker.close()
+        self.face_mesh.close()
+
+def load_frames(source, limit, width, height):
+    """Up to `limit` RGB frames of a video file or camera, decoded before timing starts"""
+    import cv2
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    frames = []
+    try:
+        while len(frames) < limit:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if frame.shape[1] != width or frame.shape[0] != height:
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        capture.release()
+    if not frames:
+        raise SystemExit(f"❌ No frames read from {source}")
+    return frames
+
+def bench_landmarker(factory, frames, warmup=10):
+    """(wall FPS, FPS per CPU core, pose found rate) of one landmarker over the frames
+
+    CPU time covers every thread of the process, so frames per CPU-second
+    is the throughput each core adds when landmarking is spread over
+    LandmarkPipeline workers.
+    """
+    landmarker = factory()
+    try:
+        for frame in frames[:warmup]:
+            landmarker(frame)
+        found = 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        for frame in frames:
+            found += bool(landmarker(frame)[1] & POSE_FOUND)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        landmarker.close()
+    return len(frames) / wall, len(frames) / cpu, found / len(frames)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Landmark extraction throughput per CPU core")
+    parser.add_argument('--source', default='0', help="video file, or a camera index")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--detect-every', type=int, nargs='+', default=[1, 5, 10, 30],
+                        help="HolisticLandmarker full-detection intervals to compare")
+    parser.add_argument('--max-side', type=int, nargs='+', default=[320, 480],
+                        help="HolisticLandmarker input sizes to compare")
+    parser.add_argument('--model-complexity', type=int, default=0)
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.frames, args.width, args.height)
+    landmarkers = [('pose+hands+face', SeparateSolutions),
+                   ('pose+hands', SolutionsLandmarker)]
+    for max_side in args.max_side:
+        for detect_every in args.detect_every:
+            landmarkers.append((f'holistic {max_side}px /{detect_every}',
+                                lambda max_side=max_side, detect_every=detect_every: HolisticLandmarker(
+                                    detect_every=detect_every, max_side=max_side,
+                                    model_complexity=args.model_complexity)))
+
+    print(f"\n🎥 Landmarking {len(frames)} frames of {args.width}x{args.height}")
+    print(f"   {'landmarker':<24} {'FPS':>7} {'FPS/core':>9} {'pose found':>11} {'speedup':>8}")
+    baseline = None
+    for name, factory in landmarkers:
+        fps, fps_per_core, found = bench_landmarker(factory, frames)
+        baseline = baseline or fps_per_core
+        print(f"   {name:<24} {fps:>7.1f} {fps_per_core:>9.1f} {found:>10.0%} {fps_per_core / baseline:>7.1f}x")
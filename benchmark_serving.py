@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+def wait_until_up(url, timeout=180):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"server at {url} did not come up within {timeout}s")
+
+def post_json(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return (time.perf_counter() - start) * 1000
+
+def post_slowly(url, path, payload, upload_ms, chunks=4):
+    """POST JSON the way a slow mobile link does: the body trickles in over `upload_ms`"""
+    host, port = url.split('//')[1].split(':')
+    body = json.dumps(payload).encode('utf-8')
+    head = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode('ascii')
+    step = -(-len(body) // chunks)
+    start = time.perf_counter()
+    with socket.create_connection((host, int(port)), timeout=60) as conn:
+        conn.sendall(head)
+        for i in range(0, len(body), step):
+            time.sleep(upload_ms / 1000 / chunks)
+            conn.sendall(body[i:i + step])
+        while conn.recv(65536):
+            pass
+    return (time.perf_counter() - start) * 1000
+
+def run_load(url, concurrency, requests_per_client, upload_ms=0, batch_size=0):
+    """Hammer /predict (or /batch_predict with `batch_size` poses) from `concurrency` clients
+
+    Returns (req/s, p50 ms, p99 ms).
+    """
+    rng = np.random.default_rng(0)
+    if batch_size:
+        path, payload = '/batch_predict', {'pose_list': rng.uniform(-1, 1, (batch_size, 225)).tolist()}
+    else:
+        path, payload = '/predict', {'pose_features': rng.uniform(-1, 1, 225).tolist()}
+
+    def client(seed):
+        if upload_ms:
+            # Independent arrivals; lockstep clients would all finish uploading
+            # into kernel buffers together and hide the cost of slow uploads
+            jitter = np.random.default_rng(seed).uniform(0, upload_ms / 1000, requests_per_client)
+            latencies = []
+            for delay in jitter:
+                time.sleep(delay)
+                latencies.append(post_slowly(url, path, payload, upload_ms))
+            return latencies
+        return [post_json(url + path, payload) for _ in range(requests_per_client)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = [ms for batch in pool.map(client, range(concurrency)) for ms in batch]
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def serve(command, env, port):
+    """Start a server subprocess and wait for /ready"""
+    process = subprocess.Popen(command, env={**os.environ, **env, 'PORT': str(port)},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}")
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+def bench_layouts(layouts, concurrency, requests_per_client, port):
+    """Throughput and latency of the pre-fork gunicorn config per workers x threads layout"""
+    print(f"\n🏭 Pre-fork gunicorn, {concurrency} concurrent clients")
+    print(f"   {'workers':>7} {'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for layout in layouts:
+        workers, threads = (int(n) for n in layout.split('x'))
+        env = {'WEB_CONCURRENCY': str(workers), 'INFERENCE_THREADS': str(threads)}
+        process = serve([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'wsgi:app'],
+                        env, port)
+        try:
+            rps, p50, p99 = run_load(f"http://127.0.0.1:{port}", concurrency, requests_per_client)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"   {workers:>7} {threads:>7} {rps:>8.1f} {p50:>8.2f} {p99:>8.2f}")
+
+def bench_asgi(concurrency, requests_per_client, upload_ms, batch_size, port):
+    """Sync gunicorn workers against the ASGI entry point under slow-uploading clients"""
+    servers = {
+        'gunicorn sync 2w': ([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'wsgi:app'],
+                             {'WEB_CONCURRENCY': '2'}),
+        'uvicorn asgi 1w': ([sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port),
+                             '--log-level', 'warning'], {}),
+        'uvicorn asgi 1w +batch': ([sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port),
+                                    '--log-level', 'warning'], {'MICRO_BATCH_MAX_SIZE': '32'}),
+    }
+    target = f"/batch_predict x{batch_size}" if batch_size else "/predict"
+    print(f"\n🐢 {concurrency} concurrent clients, {upload_ms} ms request upload to {target}")
+    print(f"   {'server':<24} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, (command, env) in servers.items():
+        process = serve(command, env, port)
+        try:
+            rps, p50, p99 = run_load(f"http://127.0.0.1:{port}", concurrency, requests_per_client,
+                                     upload_ms, batch_size)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"   {name:<24} {rps:>8.1f} {p50:>8.2f} {p99:>8.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clinical GAT API serving benchmarks")
+    parser.add_argument('--layouts', nargs='+', default=['1x1', '1x4', '2x2', '4x1'],
+                        help="WORKERSxINFERENCE_THREADS layouts to compare")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help="requests per client")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--asgi', action='store_true',
+                        help="compare sync gunicorn with the ASGI entry point instead of layouts")
+    parser.add_argument('--upload-ms', type=float, default=200,
+                        help="simulated request upload time per client for --asgi")
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help="post this many poses to /batch_predict instead of one to /predict")
+    args = parser.parse_args()
+
+    if args.asgi:
+        bench_asgi(args.concurrency, args.requests, args.upload_ms, args.batch_size, args.port)
+    else:
+        bench_layouts(args.layouts, args.concurrency, args.requests, args.port)
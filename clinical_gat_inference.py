@@ -4,6 +4,13 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch_geometric.nn import GATConv, global_mean_pool
 import numpy as np
+import contextlib
+import functools
+import os
+import threading
+from clinical_slots import (SLOT_NAMES, SlotPredictions, build_once, clip_graph, fill_pose_matrix,
+                            finite_smoke_test, pose_matrix, group_logits, select_slots, summarize_groups,
+                            weights_version)
 
 class ClinicalGAT(nn.Module):
     def __init__(self):
@@ -36,63 +43,431 @@ class ClinicalGAT(nn.Module):
         self.slot_names = ['fever', 'cough', 'hemoptysis', 'diarrhea', 
                           'duration', 'severity', 'travel', 'exposure']
     
-    def forward(self, x, edge_index, batch):
+    def embed(self, x, edge_index, batch):
+        """(B, 128) pooled graph embeddings shared by every slot head"""
         x = F.elu(self.gat1(x, edge_index))
         x = F.elu(self.gat2(x, edge_index))
         x = F.elu(self.gat3(x, edge_index))
-        x = global_mean_pool(x, batch)
+        return global_mean_pool(x, batch)
+    
+    def forward(self, x, edge_index, batch):
+        x = self.embed(x, edge_index, batch)
         
         predictions = {}
         for i, head in enumerate(self.slot_heads):
             predictions[self.slot_names[i]] = head(x)
         return predictions
 
+class FusedSlotHeads(nn.Module):
+    """Slot heads that share a shape, stacked into grouped batched-matmul weights
+    
+    Heads are grouped by the shapes of their Linear layers (the six binary
+    128->32->2 heads and the two 3-class 128->64->32->3 heads), so each group
+    runs one baddbmm per layer instead of one nn.Linear call per head.
+    Dropout is the identity in eval mode and every hidden layer uses ReLU.
+    """
+    def __init__(self, slot_heads, slot_names):
+        super().__init__()
+        groups = {}
+        for i, head in enumerate(slot_heads):
+            linears = [m for m in head if isinstance(m, nn.Linear)]
+            shapes = tuple(tuple(linear.weight.shape) for linear in linears)
+            groups.setdefault(shapes, []).append((slot_names[i], linears))
+        
+        self.groups = []
+        for g, members in enumerate(groups.values()):
+            names = [name for name, _ in members]
+            depth = len(members[0][1])
+            for d in range(depth):
+                # (G, in, out) weights and (G, 1, out) biases for baddbmm
+                weight = torch.stack([linears[d].weight.detach().t() for _, linears in members])
+                bias = torch.stack([linears[d].bias.detach() for _, linears in members]).unsqueeze(1)
+                self.register_buffer(f'group{g}_weight{d}', weight.contiguous())
+                self.register_buffer(f'group{g}_bias{d}', bias)
+            self.groups.append((names, depth))
+        self.slot_names = list(slot_names)
+        # Resolved once so the hot path does no attribute-name formatting
+        self.params = [[(getattr(self, f'group{g}_weight{d}'), getattr(self, f'group{g}_bias{d}'))
+                        for d in range(depth)]
+                       for g, (_, depth) in enumerate(self.groups)]
+        self.selections = {}
+    
+    def select(self, slots=None):
+        """(groups, params) covering only `slots`, gathered once per selection
+        
+        Groups with no selected head are dropped and partly selected groups
+        keep just the selected rows of their stacked weights.
+        """
+        if slots is None:
+            return self.groups, self.params
+        key = tuple(slots)
+        selection = self.selections.get(key)
+        if selection is None:
+            groups, params = [], []
+            for (names, depth), layers in zip(self.groups, self.params):
+                keep = [j for j, name in enumerate(names) if name in key]
+                if len(keep) == len(names):
+                    groups.append((names, depth))
+                    params.append(layers)
+                elif keep:
+                    index = torch.tensor(keep)
+                    groups.append(([names[j] for j in keep], depth))
+                    params.append([(weight.index_select(0, index), bias.index_select(0, index))
+                                   for weight, bias in layers])
+            selection = self.selections[key] = (groups, params)
+        return selection
+    
+    def forward_groups(self, x, out=None, slots=None):
+        """Logits for each head group as (G, N, C) tensors
+        
+        `out` optionally holds one preallocated buffer per group and layer,
+        which receive the activations in place; it only fits the full set of
+        heads, so it is ignored when `slots` selects a subset.
+        """
+        groups, params = self.select(slots)
+        if slots is not None:
+            out = None
+        outputs = []
+        for g, ((names, depth), params) in enumerate(zip(groups, params)):
+            h = x.unsqueeze(0).expand(len(names), -1, -1)
+            for d, (weight, bias) in enumerate(params):
+                h = torch.baddbmm(bias, h, weight, out=None if out is None else out[g][d])
+                if d < depth - 1:
+                    h = F.relu(h, inplace=out is not None)
+            outputs.append(h)
+        return outputs
+    
+    def forward(self, x):
+        grouped = {}
+        for (names, _), logits in zip(self.groups, self.forward_groups(x)):
+            for j, name in enumerate(names):
+                grouped[name] = logits[j]
+        # Same slot order as ClinicalGAT.forward
+        return {name: grouped[name] for name in self.slot_names}
+
+class FoldedClinicalGAT(nn.Module):
+    """ClinicalGAT collapsed for graphs whose only edges are self-loops
+    
+    When every node attends only to itself each GATConv attention softmax is
+    exactly 1, so gat1 -> gat2 -> gat3 reduce to three dense layers with bias
+    and ELU, and global_mean_pool over one node per graph is the identity.
+    """
+    def __init__(self, model):
+        super().__init__()
+        state_dict = model.state_dict()
+        # Dense weights pulled straight out of the GATConv parameters
+        for name in ('gat1', 'gat2', 'gat3'):
+            self.register_buffer(f'{name}_weight', state_dict[f'{name}.lin.weight'].detach())
+            self.register_buffer(f'{name}_bias', state_dict[f'{name}.bias'].detach())
+        
+        self.heads = FusedSlotHeads(model.slot_heads, model.slot_names)
+        self.layers = [(getattr(self, f'{name}_weight').t(), getattr(self, f'{name}_bias'))
+                       for name in ('gat1', 'gat2', 'gat3')]
+    
+    def embed(self, x, out=None):
+        """(N, 128) node embeddings, one per single-node graph
+        
+        `out` optionally holds preallocated (N, 1024), (N, 512) and (N, 128)
+        buffers that receive the three layer outputs in place.
+        """
+        if out is None:
+            x = F.elu(F.linear(x, self.gat1_weight, self.gat1_bias))
+            x = F.elu(F.linear(x, self.gat2_weight, self.gat2_bias))
+            return F.elu(F.linear(x, self.gat3_weight, self.gat3_bias))
+        
+        for (weight_t, bias), buffer in zip(self.layers, out):
+            x = torch.addmm(bias, x, weight_t, out=buffer)
+            F.elu(x, inplace=True)
+        return x
+    
+    def forward(self, x):
+        return self.heads(self.embed(x))
+
+class _Workspace:
+    """Preallocated input and activation buffers for batches of up to `capacity` poses
+    
+    Head buffers are flat, so every batch size gets contiguous (G, N, C)
+    views over their leading elements.
+    """
+    __slots__ = ('x', 'trunk', 'heads', 'views')
+    
+    def __init__(self, capacity, folded):
+        self.x = torch.zeros(capacity, 225)
+        self.trunk = self.heads = None
+        if folded is not None:
+            self.trunk = [torch.empty(capacity, getattr(folded, f'{name}_weight').shape[0])
+                          for name in ('gat1', 'gat2', 'gat3')]
+            self.heads = []
+            for g, (names, depth) in enumerate(folded.heads.groups):
+                widths = [getattr(folded.heads, f'group{g}_weight{d}').shape[2] for d in range(depth)]
+                self.heads.append([(len(names), width, torch.empty(len(names) * capacity * width))
+                                   for width in widths])
+        self.views = {}
+    
+    def view(self, count):
+        """_WorkspaceView of the first `count` rows, built once per size"""
+        view = self.views.get(count)
+        if view is None:
+            view = self.views[count] = _WorkspaceView(self, count)
+        return view
+
+class _WorkspaceView:
+    """(count, ...) tensors over a _Workspace's buffers, as used by one call"""
+    __slots__ = ('x', 'features', 'trunk', 'heads')
+    
+    def __init__(self, workspace, count):
+        self.x = workspace.x[:count]
+        self.features = self.x.numpy()
+        self.trunk = self.heads = None
+        if workspace.trunk is not None:
+            self.trunk = [buffer[:count] for buffer in workspace.trunk]
+            self.heads = [[flat[:size * count * width].view(size, count, width) for size, width, flat in group]
+                          for group in workspace.heads]
+
+class _WorkspacePool:
+    """Free lists of workspaces keyed by power-of-two capacity
+    
+    A batch borrows a view of the smallest bucket that fits it, so mixed
+    batch sizes share a handful of workspaces instead of one set per size.
+    Sizes above `max_batch` get a throwaway workspace, and at most
+    `per_size` idle workspaces are kept for each bucket.
+    """
+    def __init__(self, folded, max_batch=256, per_size=4, min_bucket=8):
+        self.folded = folded
+        self.max_batch = max_batch
+        self.per_size = per_size
+        self.min_bucket = min_bucket
+        self.free = {}
+        self.lock = threading.Lock()
+    
+    @contextlib.contextmanager
+    def borrow(self, count):
+        capacity = count if count > self.max_batch else max(self.min_bucket, 1 << (count - 1).bit_length())
+        with self.lock:
+            idle = self.free.get(capacity)
+            workspace = idle.pop() if idle else None
+        if workspace is None:
+            workspace = _Workspace(capacity, self.folded)
+        try:
+            yield workspace.view(count)
+        finally:
+            if capacity <= self.max_batch:
+                with self.lock:
+                    idle = self.free.setdefault(capacity, [])
+                    if len(idle) < self.per_size:
+                        idle.append(workspace)
+
 class ClinicalGATInference:
-    def __init__(self, weights_path='clinical_gat_weights.pth'):
+    BACKENDS = ('torch', 'onnxruntime')
+    
+    def __init__(self, weights_path='clinical_gat_weights.pth', folded=True,
+                 backend='torch', onnx_path=None, buffer_pool=True, verbose=True):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {self.BACKENDS}")
+        
+        self.weights_path = weights_path
+        self.version = weights_version(weights_path)
+        self._options = {'folded': folded, 'backend': backend, 'buffer_pool': buffer_pool}
+        
         # Create model architecture
         self.model = ClinicalGAT()
         # Load only the weights
-        state_dict = torch.load(weights_path, map_location='cpu')
-        self.model.load_state_dict(state_dict)
+        self.model.load_state_dict(**self._load_state_dict(weights_path))
         self.model.eval()
-        print("✅ Clinical GAT Model Loaded - 86.7% Accuracy")
         
-    def predict(self, pose_features):
+        # Single-node graphs skip message passing entirely
+        self.folded = None
+        if folded or backend == 'onnxruntime':
+            self.folded = FoldedClinicalGAT(self.model).eval()
+        
+        # Serve from an exported ONNX graph of the folded model
+        self.onnx = None
+        if backend == 'onnxruntime':
+            from clinical_gat_onnx import OnnxClinicalGAT, export_onnx
+            # A per-version graph, so a stale export is never served
+            onnx_path = onnx_path or f"{os.path.splitext(weights_path)[0]}.{self.version}.onnx"
+            build_once(onnx_path, lambda path: export_onnx(self.folded, path))
+            self.onnx = OnnxClinicalGAT(onnx_path)
+        
+        if self.folded is not None:
+            try:
+                self.check_parity()
+            except RuntimeError as e:
+                print(f"⚠️ Falling back to the reference GAT forward: {e}")
+                self.folded = None
+                self.onnx = None
+        self.backend = backend if self.onnx is not None else 'torch'
+        
+        # Reused input/activation buffers so steady-state calls allocate nothing new
+        self._workspaces = _WorkspacePool(self.folded) if buffer_pool else None
+        if verbose:
+            print("✅ Clinical GAT Model Loaded - 86.7% Accuracy")
+    
+    def reload(self, weights_path=None):
+        """Load and verify new weights as a separate engine with this one's settings
+        
+        This engine is left untouched, so callers swap the returned one in and
+        requests already running here finish on the old weights. Raises
+        RuntimeError if the new engine fails the parity or smoke test, or
+        fell back to a slower path than this one uses.
+        """
+        weights_path = weights_path or self.weights_path
+        engine = ClinicalGATInference(weights_path, verbose=False, **self._options)
+        if engine.backend != self.backend or (engine.folded is None) != (self.folded is None):
+            raise RuntimeError(f"new weights fell back to the reference path (backend {engine.backend})")
+        engine.check_parity()
+        finite_smoke_test(engine)
+        engine.set_num_threads(torch.get_num_threads())
+        return engine
+    
+    def set_num_threads(self, num_threads):
+        """Size the intra-op thread pool used for inference in this process"""
+        torch.set_num_threads(num_threads)
+        if self.onnx is not None:
+            self.onnx.set_num_threads(num_threads)
+    
+    @staticmethod
+    def _load_state_dict(weights_path):
+        """load_state_dict() arguments for a .pth pickle or a flat .safetensors file
+        
+        Flat files are memory-mapped and the parameters are assigned as views
+        over the mapping, so every process serving the same file shares one
+        page-cache copy of the weights instead of holding a private one.
+        """
+        if weights_path.endswith('.safetensors'):
+            from clinical_gat_mmap import map_weights
+            arrays = map_weights(weights_path)
+            state_dict = {name: torch.from_numpy(array) for name, array in arrays.items()}
+            return {'state_dict': state_dict, 'assign': True}
+        return {'state_dict': torch.load(weights_path, map_location='cpu')}
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _self_loop_graph(count):
+        """Edge index and batch vector for `count` disconnected single-node graphs"""
+        nodes = torch.arange(count, dtype=torch.long)
+        return torch.stack([nodes, nodes]), nodes
+    
+    def _forward(self, x):
+        """Run the active torch execution path on an (N, 225) tensor"""
+        if self.folded is not None:
+            return self.folded(x)
+        edge_index, batch = self._self_loop_graph(x.shape[0])
+        return self.model(x, edge_index, batch)
+    
+    def _heads(self, slots=None):
+        """(slot names, head modules) for the reference path"""
+        names = slots or self.model.slot_names
+        heads = dict(zip(self.model.slot_names, self.model.slot_heads))
+        return names, [heads[name] for name in names]
+    
+    def _logits(self, features):
+        """Slot name -> (N, C) NumPy logits for an (N, 225) float32 array"""
+        if self.onnx is not None:
+            return self.onnx.logits(features)
+        with torch.no_grad():
+            predictions = self._forward(torch.from_numpy(features))
+        return {slot: logits.numpy() for slot, logits in predictions.items()}
+    
+    def _group_logits(self, features, workspace=None, slots=None):
+        """[(slots, (G, N, C) logits), ...] for an (N, 225) float32 array
+        
+        With a workspace, `features` is its input buffer and the folded path
+        writes every activation into the workspace's preallocated buffers.
+        `slots` limits the work to those heads; the trunk still runs once.
+        """
+        if self.onnx is not None:
+            return group_logits(self.onnx.logits(features, slots))
+        with torch.no_grad():
+            if self.folded is None:
+                edge_index, batch = self._self_loop_graph(features.shape[0])
+                return self._embedding_groups(self.model.embed(torch.from_numpy(features), edge_index, batch),
+                                              slots)
+            if workspace is None:
+                return self._embedding_groups(self.folded.embed(torch.from_numpy(features)), slots)
+            heads = self.folded.heads
+            outputs = heads.forward_groups(self.folded.embed(workspace.x, out=workspace.trunk),
+                                           out=workspace.heads, slots=slots)
+            return [(names, logits.numpy()) for (names, _), logits in zip(heads.select(slots)[0], outputs)]
+    
+    def _embedding_groups(self, embedding, slots=None):
+        """Grouped head logits for (B, 128) graph embeddings"""
+        if self.folded is None:
+            names, heads = self._heads(slots)
+            return group_logits({name: head(embedding).numpy() for name, head in zip(names, heads)})
+        heads = self.folded.heads
+        outputs = heads.forward_groups(embedding, slots=slots)
+        return [(names, logits.numpy()) for (names, _), logits in zip(heads.select(slots)[0], outputs)]
+    
+    def check_parity(self, num_poses=32, atol=1e-5, seed=0):
+        """Compare the active execution path against ClinicalGAT.forward
+        
+        Returns the largest absolute logit difference and raises RuntimeError
+        when it exceeds `atol`.
+        """
+        generator = torch.Generator().manual_seed(seed)
+        x = torch.rand(num_poses, 225, generator=generator) * 2 - 1
+        with torch.no_grad():
+            edge_index, batch = self._self_loop_graph(num_poses)
+            reference = self.model(x, edge_index, batch)
+        candidate = self._logits(x.numpy())
+
+        # NaN anywhere fails the check: it compares False against atol and poisons max()
+        diffs = [np.abs(reference[slot].numpy() - candidate[slot]).max() for slot in reference]
+        max_diff = float(np.max(diffs))
+        if not max_diff <= atol:
+            raise RuntimeError(f"parity check failed: max |diff| {max_diff:.2e} > {atol:.0e}")
+        return max_diff
+
+    def predict(self, pose_features, slots=None):
         """Predict clinical symptoms from pose features"""
+        pose_features = np.asarray(pose_features, dtype=np.float32)
+        return self.predict_batch(pose_features.reshape(1, -1), slots)[0]
+    
+    def predict_batch(self, pose_list, slots=None):
+        """Predict clinical symptoms for many poses with a single forward pass
+        
+        Each pose becomes one node of a disconnected graph, so every node only
+        attends to its own self-loop and global_mean_pool returns one embedding
+        per pose - identical to calling predict() on each pose separately.
+        `slots` (e.g. ['fever', 'cough']) runs and returns only those heads.
+        """
+        return self.predict_compact(pose_list, slots).to_dicts()
+    
+    def predict_compact(self, pose_list, slots=None):
+        """Like predict_batch, but returns a SlotPredictions of class/confidence arrays"""
+        slots = select_slots(slots)
+        slot_names = slots or SLOT_NAMES
+        count = len(pose_list)
+        if count == 0:
+            return SlotPredictions.empty(slot_names)
+        if self._workspaces is None:
+            return summarize_groups(self._group_logits(pose_matrix(pose_list), slots=slots), slot_names)
+        
+        with self._workspaces.borrow(count) as workspace:
+            features = fill_pose_matrix(pose_list, workspace.features)
+            return summarize_groups(self._group_logits(features, workspace, slots), slot_names)
+    
+    def predict_sequence(self, frames, window_edges=1, slots=None):
+        """Predict clinical symptoms from a signed clip of (T, 225) pose frames
+        
+        The frames become the nodes of one graph with temporal edges between
+        frames up to `window_edges` apart, so GAT attention mixes motion across
+        the clip before global_mean_pool reduces it to one embedding.
+        """
+        return self.predict_sequences([frames], window_edges, slots)[0]
+    
+    def predict_sequences(self, clips, window_edges=1, slots=None):
+        """Predict clinical symptoms for a ragged batch of clips in one forward pass"""
+        return self.predict_sequences_compact(clips, window_edges, slots).to_dicts()
+    
+    def predict_sequences_compact(self, clips, window_edges=1, slots=None):
+        """Like predict_sequences, but returns a SlotPredictions"""
+        slots = select_slots(slots)
+        if len(clips) == 0:
+            return SlotPredictions.empty(slots or SLOT_NAMES)
+        x, edge_index, batch = clip_graph(clips, window_edges)
         with torch.no_grad():
-            # Ensure 225 features
-            if len(pose_features) > 225:
-                pose_features = pose_features[:225]
-            elif len(pose_features) < 225:
-                pose_features = np.pad(pose_features, (0, 225 - len(pose_features)))
-            
-            # Create graph data
-            x = torch.FloatTensor(pose_features).unsqueeze(0)
-            edge_index = torch.tensor([[0], [0]], dtype=torch.long)
-            batch = torch.tensor([0], dtype=torch.long)
-            
-            # Get predictions
-            predictions = self.model(x, edge_index, batch)
-            
-            # Format results
-            results = {}
-            class_mappings = {
-                'fever': ['No', 'Yes'],
-                'cough': ['No', 'Yes'], 
-                'hemoptysis': ['No', 'Yes'],
-                'diarrhea': ['No', 'Yes'],
-                'travel': ['No', 'Yes'],
-                'exposure': ['No', 'Yes'],
-                'duration': ['Short', 'Medium', 'Long'],
-                'severity': ['Mild', 'Moderate', 'Severe']
-            }
-            
-            for slot, logits in predictions.items():
-                probs = F.softmax(logits, dim=1)
-                confidence, pred_class = torch.max(probs, 1)
-                results[slot] = {
-                    'prediction': class_mappings[slot][pred_class.item()],
-                    'confidence': confidence.item()
-                }
-            
-            return results
+            embedding = self.model.embed(torch.from_numpy(x), torch.from_numpy(edge_index),
+                                         torch.from_numpy(batch))
+            return summarize_groups(self._embedding_groups(embedding, slots), slots or SLOT_NAMES)
@@ -0,0 +1,77 @@
+import argparse
+import json
+import struct
+import numpy as np
+
+# safetensors dtype tags for the arrays we store
+DTYPES = {'F32': np.float32, 'F64': np.float64, 'I64': np.int64}
+DTYPE_TAGS = {np.dtype(dtype): tag for tag, dtype in DTYPES.items()}
+
+def write_weights(arrays, path):
+    """Write a name -> array mapping as one flat, memory-mappable file
+
+    The layout follows safetensors: an 8-byte little-endian header length, a
+    JSON header of dtype/shape/byte offsets, then every tensor's raw
+    little-endian bytes back to back.
+    """
+    # Wider dtypes first: every tensor's size is a multiple of its itemsize, so
+    # each one then starts aligned to its own itemsize without leaving holes
+    # between tensors (which safetensors does not allow)
+    arrays = {name: np.ascontiguousarray(array) for name, array in
+              sorted(arrays.items(), key=lambda item: -np.asarray(item[1]).dtype.itemsize)}
+    header, offset = {}, 0
+    for name, array in arrays.items():
+        header[name] = {
+            'dtype': DTYPE_TAGS[array.dtype],
+            'shape': list(array.shape),
+            'data_offsets': [offset, offset + array.nbytes],
+        }
+        offset += array.nbytes
+
+    # Pad the header so the data section itself starts 8-byte aligned
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    encoded += b' ' * (-len(encoded) % 8)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        for array in arrays.values():
+            f.write(array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes())
+    return path
+
+def map_weights(path, mode='c'):
+    """Map a flat weight file and return name -> array views over the mapping
+
+    The default copy-on-write mode keeps the arrays writable (so torch can
+    wrap them without copying) while every process that maps the file shares
+    one page-cache copy until something writes to it.
+    """
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop('__metadata__', None)
+
+    data = np.memmap(path, dtype=np.uint8, mode=mode, offset=8 + header_size)
+    arrays = {}
+    for name, info in header.items():
+        begin, end = info['data_offsets']
+        dtype = np.dtype(DTYPES[info['dtype']]).newbyteorder('<')
+        arrays[name] = data[begin:end].view(dtype).reshape(info['shape'])
+    return arrays
+
+def convert_weights(weights_path='clinical_gat_weights.pth', output_path='clinical_gat_weights.safetensors'):
+    """Convert the torch state dict into a flat memory-mappable weight file"""
+    import torch
+
+    state_dict = torch.load(weights_path, map_location='cpu')
+    arrays = {name: tensor.detach().float().numpy() for name, tensor in state_dict.items()}
+    write_weights(arrays, output_path)
+    print(f"📦 Converted {len(arrays)} tensors to {output_path}")
+    return output_path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert Clinical GAT weights to a memory-mapped flat file")
+    parser.add_argument('--weights', default='clinical_gat_weights.pth')
+    parser.add_argument('--output', default='clinical_gat_weights.safetensors')
+    args = parser.parse_args()
+
+    convert_weights(args.weights, args.output)
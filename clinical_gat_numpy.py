@@ -0,0 +1,271 @@
+import argparse
+import os
+import numpy as np
+from clinical_slots import (SLOT_NAMES, SlotPredictions, build_once, clip_graph, finite_smoke_test,
+                            pose_matrix, select_slots, summarize_groups, weights_version)
+
+# (name, heads, concat) for gat1 -> gat2 -> gat3, as in ClinicalGAT
+GAT_LAYERS = (('gat1', 8, True), ('gat2', 4, True), ('gat3', 1, False))
+
+def convert_weights(weights_path='clinical_gat_weights.pth', output_path='clinical_gat_weights.npz'):
+    """Convert the torch state dict into a NumPy .npz archive"""
+    import torch
+
+    state_dict = torch.load(weights_path, map_location='cpu')
+    arrays = {name: tensor.detach().float().numpy() for name, tensor in state_dict.items()}
+    np.savez(output_path, **arrays)
+    print(f"📦 Converted {len(arrays)} tensors to {output_path}")
+    return output_path
+
+def _elu(x):
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+class NumpyClinicalGAT:
+    """Dependency-free ClinicalGAT inference using only NumPy
+
+    Mirrors ClinicalGAT.forward, including GATConv attention over arbitrary
+    graphs, and ClinicalGATInference.predict/predict_batch, which take a
+    dense fast path because their graphs only contain self-loops.
+    """
+    def __init__(self, weights_path='clinical_gat_weights.npz', verbose=True):
+        if weights_path.endswith('.safetensors'):
+            # Views over a shared memory mapping rather than private copies
+            from clinical_gat_mmap import map_weights
+            weights = map_weights(weights_path)
+        else:
+            with np.load(weights_path) as archive:
+                weights = {name: archive[name] for name in archive.files}
+        self.weights_path = weights_path
+        self.version = weights_version(weights_path)
+        self._build(weights)
+        if verbose:
+            print("✅ Clinical GAT Model Loaded (NumPy) - 86.7% Accuracy")
+
+    def reload(self, weights_path=None):
+        """Load and smoke-test new weights as a separate engine, leaving this one untouched
+
+        A .pth file is converted once to a per-version .npz next to it.
+        """
+        weights_path = weights_path or self.weights_path
+        version = weights_version(weights_path)
+        if weights_path.endswith('.pth'):
+            npz_path = f"{os.path.splitext(weights_path)[0]}.{version}.npz"
+            engine = NumpyClinicalGAT(build_once(npz_path, lambda path: convert_weights(weights_path, path)),
+                                      verbose=False)
+            engine.version = version
+        else:
+            engine = NumpyClinicalGAT(weights_path, verbose=False)
+        finite_smoke_test(engine)
+        return engine
+
+    def set_num_threads(self, num_threads):
+        """Size NumPy's BLAS pool (OpenBLAS, MKL) for this process
+
+        Needs threadpoolctl; without it the pool keeps the size it got from
+        OPENBLAS_NUM_THREADS/MKL_NUM_THREADS at import (1 under pre-fork).
+        """
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            print("⚠️ `pip install threadpoolctl` to size the NumPy backend's BLAS threads")
+            return
+        threadpool_limits(num_threads, user_api='blas')
+
+    def _build(self, weights):
+        """Arrange a name -> float32 array mapping for inference"""
+        weights = {name: np.asarray(array, dtype=np.float32) for name, array in weights.items()}
+
+        self.layers = []
+        for name, heads, concat in GAT_LAYERS:
+            self.layers.append((
+                weights[f'{name}.lin.weight'].T,
+                weights[f'{name}.bias'],
+                weights[f'{name}.att_src'],
+                weights[f'{name}.att_dst'],
+                heads,
+                concat,
+            ))
+
+        # Group same-shape slot heads into stacked (G, in, out) weights
+        groups = {}
+        for i, slot in enumerate(SLOT_NAMES):
+            prefix = f'slot_heads.{i}.'
+            indices = sorted(int(name[len(prefix):].split('.')[0])
+                             for name in weights if name.startswith(prefix) and name.endswith('.weight'))
+            linears = [(weights[f'{prefix}{j}.weight'], weights[f'{prefix}{j}.bias']) for j in indices]
+            shapes = tuple(weight.shape for weight, _ in linears)
+            groups.setdefault(shapes, []).append((slot, linears))
+
+        self.head_groups = []
+        for members in groups.values():
+            names = [slot for slot, _ in members]
+            stacked = []
+            for d in range(len(members[0][1])):
+                weight = np.stack([linears[d][0].T for _, linears in members])
+                bias = np.stack([linears[d][1] for _, linears in members])[:, None, :]
+                stacked.append((weight, bias))
+            self.head_groups.append((names, stacked))
+        self.selections = {}
+
+    def _select(self, slots=None):
+        """self.head_groups restricted to `slots`, gathered once per selection"""
+        if slots is None:
+            return self.head_groups
+        key = tuple(slots)
+        selection = self.selections.get(key)
+        if selection is None:
+            selection = []
+            for names, stacked in self.head_groups:
+                keep = [j for j, name in enumerate(names) if name in key]
+                if len(keep) == len(names):
+                    selection.append((names, stacked))
+                elif keep:
+                    selection.append(([names[j] for j in keep],
+                                      [(weight[keep], bias[keep]) for weight, bias in stacked]))
+            self.selections[key] = selection
+        return selection
+
+    def _head_groups(self, x, slots=None):
+        """[(slots, (G, N, C) logits), ...] for (N, 128) graph embeddings"""
+        outputs = []
+        for names, stacked in self._select(slots):
+            h = x[None]
+            for d, (weight, bias) in enumerate(stacked):
+                h = np.matmul(h, weight) + bias
+                if d < len(stacked) - 1:
+                    h = np.maximum(h, 0)
+            outputs.append((names, h))
+        return outputs
+
+    def _heads(self, x):
+        """Slot name -> (N, C) logits for (N, 128) graph embeddings"""
+        grouped = {}
+        for names, logits in self._head_groups(x):
+            for j, slot in enumerate(names):
+                grouped[slot] = logits[j]
+        return {slot: grouped[slot] for slot in SLOT_NAMES}
+
+    @staticmethod
+    def _gat_conv(x, src, dst, layer):
+        """GATConv message passing over edges src -> dst (self-loops included)"""
+        weight_t, bias, att_src, att_dst, heads, concat = layer
+        count = x.shape[0]
+        h = (x @ weight_t).reshape(count, heads, -1)
+        a_src = (h * att_src).sum(-1)
+        a_dst = (h * att_dst).sum(-1)
+
+        alpha = a_src[src] + a_dst[dst]
+        alpha = np.where(alpha > 0, alpha, 0.2 * alpha)
+
+        # Softmax over the incoming edges of each target node
+        alpha_max = np.full((count, heads), -np.inf, dtype=np.float32)
+        np.maximum.at(alpha_max, dst, alpha)
+        alpha = np.exp(alpha - alpha_max[dst])
+        denom = np.zeros((count, heads), dtype=np.float32)
+        np.add.at(denom, dst, alpha)
+        alpha = alpha / (denom[dst] + 1e-16)
+
+        out = np.zeros_like(h)
+        np.add.at(out, dst, h[src] * alpha[..., None])
+        out = out.reshape(count, -1) if concat else out.mean(axis=1)
+        return out + bias
+
+    def forward(self, x, edge_index, batch):
+        """NumPy equivalent of ClinicalGAT.forward for an arbitrary graph batch"""
+        return self._heads(self.embed_graph(x, edge_index, batch))
+
+    def embed_graph(self, x, edge_index, batch):
+        """(B, 128) pooled embeddings for an arbitrary graph batch"""
+        x = np.asarray(x, dtype=np.float32)
+        edge_index = np.asarray(edge_index, dtype=np.int64)
+        batch = np.asarray(batch, dtype=np.int64)
+        count = x.shape[0]
+
+        # GATConv drops existing self-loops and adds one per node
+        src, dst = edge_index
+        keep = src != dst
+        nodes = np.arange(count)
+        src = np.concatenate([src[keep], nodes])
+        dst = np.concatenate([dst[keep], nodes])
+
+        for layer in self.layers:
+            x = _elu(self._gat_conv(x, src, dst, layer))
+
+        # global_mean_pool
+        num_graphs = int(batch.max()) + 1 if count else 0
+        pooled = np.zeros((num_graphs, x.shape[1]), dtype=np.float32)
+        np.add.at(pooled, batch, x)
+        pooled /= np.maximum(np.bincount(batch, minlength=num_graphs), 1)[:, None]
+        return pooled
+
+    def embed(self, features):
+        """(N, 128) embeddings for an (N, 225) array of single-node graphs
+
+        Every attention softmax over a lone self-loop is 1, so the GAT trunk
+        reduces to dense layers and pooling is the identity.
+        """
+        x = features
+        for weight_t, bias, _, _, _, _ in self.layers:
+            x = _elu(x @ weight_t + bias)
+        return x
+
+    def logits(self, features):
+        """Slot name -> (N, C) logits for an (N, 225) array of single-node graphs"""
+        return self._heads(self.embed(features))
+
+    def predict(self, pose_features, slots=None):
+        """Predict clinical symptoms from pose features"""
+        return self.predict_batch([pose_features], slots)[0]
+
+    def predict_batch(self, pose_list, slots=None):
+        """Predict clinical symptoms for many poses in one pass"""
+        return self.predict_compact(pose_list, slots).to_dicts()
+
+    def predict_compact(self, pose_list, slots=None):
+        """Like predict_batch, but returns a SlotPredictions of class/confidence arrays"""
+        slots = select_slots(slots)
+        features = pose_matrix(pose_list)
+        if features.shape[0] == 0:
+            return SlotPredictions.empty(slots or SLOT_NAMES)
+        return summarize_groups(self._head_groups(self.embed(features), slots), slots or SLOT_NAMES)
+
+    def predict_sequence(self, frames, window_edges=1, slots=None):
+        """Predict clinical symptoms from a signed clip of (T, 225) pose frames"""
+        return self.predict_sequences([frames], window_edges, slots)[0]
+
+    def predict_sequences(self, clips, window_edges=1, slots=None):
+        """Predict clinical symptoms for a ragged batch of clips in one pass"""
+        return self.predict_sequences_compact(clips, window_edges, slots).to_dicts()
+
+    def predict_sequences_compact(self, clips, window_edges=1, slots=None):
+        """Like predict_sequences, but returns a SlotPredictions"""
+        slots = select_slots(slots)
+        if len(clips) == 0:
+            return SlotPredictions.empty(slots or SLOT_NAMES)
+        embedding = self.embed_graph(*clip_graph(clips, window_edges))
+        return summarize_groups(self._head_groups(embedding, slots), slots or SLOT_NAMES)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert Clinical GAT weights for the NumPy engine")
+    parser.add_argument('--weights', default='clinical_gat_weights.pth')
+    parser.add_argument('--output', default='clinical_gat_weights.npz')
+    args = parser.parse_args()
+
+    convert_weights(args.weights, args.output)
+
+    # Parity against the torch reference on a multi-node graph batch
+    import torch
+    from clinical_gat_inference import ClinicalGATInference
+
+    reference = ClinicalGATInference(args.weights, folded=False).model
+    engine = NumpyClinicalGAT(args.output)
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-1, 1, (12, 225)).astype(np.float32)
+    edge_index = np.array([[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 1, 4],
+                           [1, 2, 3, 0, 5, 6, 7, 4, 9, 10, 11, 8, 3, 7]])
+    batch = np.repeat(np.arange(3), 4)
+    with torch.no_grad():
+        expected = reference(torch.from_numpy(x), torch.from_numpy(edge_index), torch.from_numpy(batch))
+    actual = engine.forward(x, edge_index, batch)
+    max_diff = max(float(np.abs(expected[slot].numpy() - actual[slot]).max()) for slot in SLOT_NAMES)
+    print(f"✅ NumPy parity max |diff|: {max_diff:.2e}")
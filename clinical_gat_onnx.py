@@ -0,0 +1,103 @@
+import argparse
+from clinical_slots import (SLOT_NAMES, NUM_FEATURES, SlotPredictions, pose_matrix, group_logits,
+                            select_slots, summarize_groups, weights_version)
+
+def export_onnx(model, onnx_path='clinical_gat_weights.onnx', opset_version=17):
+    """Export a FoldedClinicalGAT to ONNX with a dynamic batch dimension
+
+    The folded model is exported rather than ClinicalGAT itself: served graphs
+    only ever contain self-loops, and the dense form avoids the scatter ops of
+    GATConv message passing. Outputs are one (N, C) logits tensor per slot.
+    """
+    import torch
+
+    class SlotLogits(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, x):
+            predictions = self.model(x)
+            return tuple(predictions[slot] for slot in SLOT_NAMES)
+
+    dummy = torch.zeros(2, NUM_FEATURES)
+    dynamic_axes = {'pose_features': {0: 'batch'}}
+    dynamic_axes.update({slot: {0: 'batch'} for slot in SLOT_NAMES})
+    torch.onnx.export(SlotLogits(model).eval(), (dummy,), onnx_path,
+                      input_names=['pose_features'], output_names=SLOT_NAMES,
+                      dynamic_axes=dynamic_axes, opset_version=opset_version)
+    print(f"📦 Exported ONNX graph to {onnx_path}")
+    return onnx_path
+
+class OnnxClinicalGAT:
+    """Serve Clinical GAT predictions from an exported ONNX graph
+
+    Needs only onnxruntime and NumPy, so it can run in an image without torch
+    or torch-geometric. Results match ClinicalGATInference.predict.
+    """
+    def __init__(self, onnx_path='clinical_gat_weights.onnx', num_threads=None):
+        self.onnx_path = onnx_path
+        self.version = weights_version(onnx_path)
+        self.set_num_threads(num_threads)
+
+    def set_num_threads(self, num_threads):
+        """(Re)create the session with an intra-op pool of `num_threads`
+
+        onnxruntime's pool threads do not survive fork(), so pre-forked
+        workers call this after forking to get a working pool of their own.
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnxruntime backend requires `pip install onnxruntime`") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def logits(self, features, slots=None):
+        """Slot name -> (N, C) logits for an (N, 225) float32 array
+
+        Only the outputs named in `slots` are fetched. The folded graph runs
+        each group of same-shaped heads as one fused matmul, so the other
+        heads of a group are still computed: fetching fever alone still
+        runs all six binary heads.
+        """
+        names = slots or SLOT_NAMES
+        outputs = self.session.run(names, {'pose_features': features})
+        return dict(zip(names, outputs))
+
+    def predict(self, pose_features, slots=None):
+        """Predict clinical symptoms from pose features"""
+        return self.predict_batch([pose_features], slots)[0]
+
+    def predict_batch(self, pose_list, slots=None):
+        """Predict clinical symptoms for many poses in one session run"""
+        return self.predict_compact(pose_list, slots).to_dicts()
+
+    def predict_compact(self, pose_list, slots=None):
+        """Like predict_batch, but returns a SlotPredictions of class/confidence arrays"""
+        slots = select_slots(slots)
+        features = pose_matrix(pose_list)
+        if features.shape[0] == 0:
+            return SlotPredictions.empty(slots or SLOT_NAMES)
+        return summarize_groups(group_logits(self.logits(features, slots)), slots or SLOT_NAMES)
+
+if __name__ == '__main__':
+    from clinical_gat_inference import ClinicalGATInference
+
+    parser = argparse.ArgumentParser(description="Export the Clinical GAT model to ONNX")
+    parser.add_argument('--weights', default='clinical_gat_weights.pth')
+    parser.add_argument('--output', default='clinical_gat_weights.onnx')
+    args = parser.parse_args()
+
+    engine = ClinicalGATInference(args.weights, folded=True)
+    export_onnx(engine.folded, args.output)
+
+    # Parity against the reference GAT forward
+    served = ClinicalGATInference(args.weights, backend='onnxruntime', onnx_path=args.output)
+    if served.backend != 'onnxruntime':
+        raise SystemExit("❌ ONNX graph failed the parity check")
+    print(f"✅ ONNX parity max |diff|: {served.check_parity():.2e}")
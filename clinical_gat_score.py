@@ -0,0 +1,223 @@
+import argparse
+import collections
+import itertools
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing
+import zipfile
+import numpy as np
+from clinical_slots import CLASS_MAPPINGS, SLOT_NAMES, SlotPredictions, build_once, weights_version
+
+# Offline bulk scoring: reads pose vectors from .npy, .csv or Parquet in
+# chunks, shards the chunks across a process pool whose workers all map the
+# same .safetensors weight file, and writes one label and one confidence
+# column per slot.
+#
+#   python clinical_gat_score.py poses.npy predictions.parquet --processes 8
+
+def load_engine(backend, weights_path, verbose=True):
+    if backend == 'numpy':
+        from clinical_gat_numpy import NumpyClinicalGAT
+        return NumpyClinicalGAT(weights_path, verbose=verbose)
+    from clinical_gat_inference import ClinicalGATInference
+    return ClinicalGATInference(weights_path, backend=backend, verbose=verbose)
+
+def shared_weights(weights_path):
+    """Path of a memory-mappable copy of the weights, converting a .pth once
+
+    The copy is named after the .pth's content hash, so replacing the .pth
+    never scores with a stale conversion.
+    """
+    if weights_path.endswith('.safetensors'):
+        return weights_path
+    from clinical_gat_mmap import convert_weights
+
+    stem = os.path.splitext(weights_path)[0]
+    return build_once(f"{stem}.{weights_version(weights_path)}.safetensors",
+                      lambda path: convert_weights(weights_path, path))
+
+def read_chunks(path, chunk_size):
+    """Yield (n, F) float32 arrays of up to `chunk_size` poses from a .npy, .csv or Parquet file"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        poses = np.load(path, mmap_mode='r')
+        poses = poses.reshape(1, -1) if poses.ndim == 1 else poses
+        for start in range(0, len(poses), chunk_size):
+            yield np.ascontiguousarray(poses[start:start + chunk_size], dtype=np.float32)
+    elif ext in ('.csv', '.txt'):
+        with open(path) as f:
+            first = f.readline()
+            try:
+                float(first.split(',')[0])
+                lines = itertools.chain([first], f)
+            except ValueError:
+                lines = f  # skip a header row
+            while True:
+                chunk = list(itertools.islice(lines, chunk_size))
+                if not chunk:
+                    return
+                yield np.loadtxt(chunk, delimiter=',', dtype=np.float32, ndmin=2)
+    elif ext in ('.parquet', '.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet input requires `pip install pyarrow`") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            if batch.num_columns == 1 and hasattr(batch.column(0), 'flatten'):
+                # One list<float> column holding each pose vector
+                column = batch.column(0)
+                yield np.asarray(column.flatten(), dtype=np.float32).reshape(len(column), -1)
+            else:
+                # One numeric column per feature
+                yield np.column_stack([column.to_numpy(zero_copy_only=False)
+                                       for column in batch.columns]).astype(np.float32)
+    else:
+        raise ValueError(f"unsupported input format {ext} (expected .npy, .csv or .parquet)")
+
+# Wide enough for every label, so all chunks share one string dtype
+LABEL_DTYPE = f"<U{max(len(label) for labels in CLASS_MAPPINGS.values() for label in labels)}"
+
+def prediction_columns(classes, confidences):
+    """{slot: labels, slot_confidence: confidences} columns for one chunk"""
+    labels = SlotPredictions(classes, confidences).labels()
+    columns = {}
+    for i, slot in enumerate(SLOT_NAMES):
+        columns[slot] = labels[:, i].astype(LABEL_DTYPE)
+        columns[f"{slot}_confidence"] = confidences[:, i]
+    return columns
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.file.write(','.join(f"{slot},{slot}_confidence" for slot in SLOT_NAMES) + '\n')
+
+    def write(self, columns):
+        names = list(columns)
+        for row in zip(*(columns[name].tolist() for name in names)):
+            self.file.write(','.join(value if isinstance(value, str) else f"{value:.6f}" for value in row) + '\n')
+
+    def close(self):
+        self.file.close()
+
+class NpzWriter:
+    """Streams each column's raw bytes to a temporary file and zips them into the .npz on close
+
+    Memory stays at one chunk however many poses are scored; the temporary
+    files need as much disk space as the output.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.parts = {}  # column -> [temporary file, dtype, rows]
+
+    def write(self, columns):
+        for name, values in columns.items():
+            if name not in self.parts:
+                self.parts[name] = [tempfile.TemporaryFile(), values.dtype, 0]
+            part = self.parts[name]
+            part[0].write(np.ascontiguousarray(values, dtype=part[1]).tobytes())
+            part[2] += len(values)
+
+    def close(self):
+        # The same uncompressed layout np.savez writes
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, (part, dtype, rows) in self.parts.items():
+                with archive.open(f"{name}.npy", 'w', force_zip64=True) as f:
+                    np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                             'fortran_order': False, 'shape': (rows,)})
+                    part.seek(0)
+                    shutil.copyfileobj(part, f, 1 << 20)
+                part.close()
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output requires `pip install pyarrow`") from e
+        self.pa = pa
+        schema = pa.schema([field for slot in SLOT_NAMES
+                            for field in (pa.field(slot, pa.dictionary(pa.int8(), pa.string())),
+                                          pa.field(f"{slot}_confidence", pa.float32()))])
+        self.writer = pq.ParquetWriter(path, schema)
+
+    def write(self, columns):
+        table = self.pa.table({name: self.pa.array(values).dictionary_encode() if values.dtype.kind == 'U'
+                               else self.pa.array(values) for name, values in columns.items()})
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        self.writer.close()
+
+WRITERS = {'.csv': CsvWriter, '.npz': NpzWriter, '.parquet': ParquetWriter, '.pq': ParquetWriter}
+
+_engine = None
+
+def _init_worker(backend, weights_path, num_threads):
+    global _engine
+    _engine = load_engine(backend, weights_path, verbose=False)
+    _engine.set_num_threads(num_threads)
+
+def _score_chunk(chunk):
+    predictions = _engine.predict_compact(chunk)
+    return predictions.classes, predictions.confidences
+
+def score_file(input_path, output_path, weights_path='clinical_gat_weights.pth', backend='torch',
+               processes=None, chunk_size=4096, threads_per_process=1):
+    """Score every pose in `input_path` and write columnar predictions to `output_path`
+
+    Returns (poses scored, seconds). Chunks are scored in parallel but
+    written in input order, with at most two chunks per process in flight.
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"unsupported output format {ext} (expected {', '.join(WRITERS)})")
+    weights_path = shared_weights(weights_path)
+    processes = processes or os.cpu_count()
+    if backend == 'onnxruntime' and processes > 1:
+        # Export the ONNX graph once here instead of racing in every worker
+        load_engine(backend, weights_path, verbose=False)
+
+    start = time.perf_counter()
+    writer = WRITERS[ext](output_path)
+    total = 0
+    try:
+        if processes == 1:
+            _init_worker(backend, weights_path, threads_per_process)
+            for chunk in read_chunks(input_path, chunk_size):
+                writer.write(prediction_columns(*_score_chunk(chunk)))
+                total += len(chunk)
+        else:
+            with multiprocessing.Pool(processes, _init_worker,
+                                      (backend, weights_path, threads_per_process)) as pool:
+                pending = collections.deque()
+                for chunk in read_chunks(input_path, chunk_size):
+                    pending.append(pool.apply_async(_score_chunk, (chunk,)))
+                    total += len(chunk)
+                    if len(pending) >= 2 * processes:
+                        writer.write(prediction_columns(*pending.popleft().get()))
+                while pending:
+                    writer.write(prediction_columns(*pending.popleft().get()))
+    finally:
+        writer.close()
+    return total, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score a file of pose vectors with the Clinical GAT model")
+    parser.add_argument('input', help=".npy, .csv or .parquet file with one 225-d pose per row")
+    parser.add_argument('output', help=".parquet, .npz or .csv predictions file")
+    parser.add_argument('--weights', default='clinical_gat_weights.pth',
+                        help=".pth weights are converted once to a shared .safetensors file")
+    parser.add_argument('--backend', choices=['torch', 'onnxruntime', 'numpy'], default='torch')
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--threads', type=int, default=1, help="inference threads per process")
+    parser.add_argument('--chunk-size', type=int, default=4096)
+    args = parser.parse_args()
+
+    processes = args.processes or os.cpu_count()
+    print(f"🚀 Scoring {args.input} with {processes} process(es)...")
+    total, seconds = score_file(args.input, args.output, args.weights, args.backend,
+                                processes, args.chunk_size, args.threads)
+    print(f"✅ Scored {total} poses in {seconds:.2f}s - {total / seconds:,.0f} poses/s -> {args.output}")
@@ -0,0 +1,253 @@
+import functools
+import glob
+import hashlib
+import os
+import re
+import numpy as np
+
+# Output order of ClinicalGAT.slot_heads
+SLOT_NAMES = ['fever', 'cough', 'hemoptysis', 'diarrhea',
+              'duration', 'severity', 'travel', 'exposure']
+
+CLASS_MAPPINGS = {
+    'fever': ['No', 'Yes'],
+    'cough': ['No', 'Yes'],
+    'hemoptysis': ['No', 'Yes'],
+    'diarrhea': ['No', 'Yes'],
+    'travel': ['No', 'Yes'],
+    'exposure': ['No', 'Yes'],
+    'duration': ['Short', 'Medium', 'Long'],
+    'severity': ['Mild', 'Moderate', 'Severe']
+}
+
+NUM_FEATURES = 225
+
+def weights_version(path):
+    """Short content hash identifying a weight (or exported model) file"""
+    digest = hashlib.blake2b(digest_size=6)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def build_once(path, build):
+    """Run build(path) unless `path` exists, serialized across processes by a lock file
+
+    Used for derived artifacts (.onnx, .npz) that several workers may need
+    at the same moment, e.g. when they all pick up new weights. The lock
+    file is removed once `path` exists; a failed build leaves it behind.
+    """
+    import fcntl
+
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(path):
+            build(path)
+        # Anyone still waiting on this lock finds `path` built once they get it
+        try:
+            os.unlink(path + '.lock')
+        except FileNotFoundError:
+            pass
+    return path
+
+# Serving artifacts derived from <stem>.pth: <stem>.<version>.npz/.onnx/.onnx.data
+ARTIFACT_SUFFIXES = ('.npz', '.onnx')
+
+def remove_stale_artifacts(weights_path, version):
+    """Delete the serving artifacts built for every weights version but `version`
+
+    Returns the removed paths. Artifacts another process is still building
+    (their build_once lock is held) are left alone.
+    """
+    import fcntl
+
+    stem = os.path.splitext(weights_path)[0]
+    pattern = re.compile(re.escape(os.path.basename(stem)) +
+                         r'\.([0-9a-f]{12})(\.npz|\.onnx)(\.data)?(\.lock)?$')
+    stale = {match.group(1) for match in (pattern.match(os.path.basename(path))
+                                          for path in glob.glob(glob.escape(stem) + '.*'))
+             if match is not None and match.group(1) != version}
+    removed = []
+    for stale_version in sorted(stale):
+        for suffix in ARTIFACT_SUFFIXES:
+            path = f"{stem}.{stale_version}{suffix}"
+            with open(path + '.lock', 'w') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                for artifact in (path, path + '.data', path + '.lock'):
+                    try:
+                        os.unlink(artifact)
+                    except FileNotFoundError:
+                        continue
+                    if artifact != path + '.lock':
+                        removed.append(artifact)
+    return removed
+
+def finite_smoke_test(engine, num_poses=16, seed=0):
+    """Raise RuntimeError unless `engine` returns finite confidences for random poses"""
+    poses = np.random.default_rng(seed).uniform(-1, 1, (num_poses, NUM_FEATURES)).astype(np.float32)
+    predictions = engine.predict_compact(poses)
+    if len(predictions) != num_poses or not np.isfinite(predictions.confidences).all():
+        raise RuntimeError("smoke test failed: non-finite or missing predictions")
+
+def pose_matrix(pose_list):
+    """Stack poses into an (N, 225) float32 array, padding or truncating each row"""
+    if not isinstance(pose_list, np.ndarray):
+        try:
+            pose_list = np.asarray(pose_list, dtype=np.float32)
+        except ValueError:
+            pass  # ragged rows are handled below
+
+    if isinstance(pose_list, np.ndarray) and pose_list.ndim == 2:
+        features = pose_list[:, :NUM_FEATURES].astype(np.float32, copy=False)
+        if features.shape[1] < NUM_FEATURES:
+            features = np.pad(features, ((0, 0), (0, NUM_FEATURES - features.shape[1])))
+        return features
+
+    # Ragged input - copy each pose into a zero-filled row
+    features = np.zeros((len(pose_list), NUM_FEATURES), dtype=np.float32)
+    for i, pose in enumerate(pose_list):
+        pose = np.asarray(pose, dtype=np.float32).ravel()[:NUM_FEATURES]
+        features[i, :len(pose)] = pose
+    return features
+
+def fill_pose_matrix(pose_list, out):
+    """Write poses into a preallocated (N, 225) float32 array in place
+
+    Rows longer than 225 are truncated and shorter ones zero-padded, exactly
+    like pose_matrix(), but without allocating a new matrix for array input.
+    """
+    if not isinstance(pose_list, np.ndarray):
+        try:
+            pose_list = np.asarray(pose_list, dtype=np.float32)
+        except ValueError:
+            pass  # ragged rows are handled below
+
+    if isinstance(pose_list, np.ndarray) and pose_list.ndim == 2:
+        width = min(pose_list.shape[1], NUM_FEATURES)
+        out[:, :width] = pose_list[:, :width]
+        out[:, width:] = 0
+        return out
+
+    for row, pose in zip(out, pose_list):
+        pose = np.asarray(pose, dtype=np.float32).ravel()
+        width = min(len(pose), NUM_FEATURES)
+        row[:width] = pose[:width]
+        row[width:] = 0
+    return out
+
+@functools.lru_cache(maxsize=256)
+def temporal_edge_index(num_frames, window):
+    """(2, E) edges linking every frame to each frame within `window` steps of it
+
+    Cached per (num_frames, window) and returned read-only; GATConv adds the
+    self-loops itself.
+    """
+    frames = np.arange(num_frames, dtype=np.int64)
+    src, dst = [], []
+    for offset in range(1, min(window, num_frames - 1) + 1):
+        src += [frames[:-offset], frames[offset:]]
+        dst += [frames[offset:], frames[:-offset]]
+    edges = np.stack([np.concatenate(src), np.concatenate(dst)]) if src else np.empty((2, 0), dtype=np.int64)
+    edges.flags.writeable = False
+    return edges
+
+def clip_graph(clips, window_edges):
+    """Node features, edge index and batch vector for a ragged batch of clips
+
+    Each clip of T frames becomes one T-node graph with temporal edges, and
+    all clips are packed into a single disconnected graph batch.
+    """
+    if window_edges < 0:
+        raise ValueError("window_edges must be >= 0")
+    clips = [pose_matrix(frames) for frames in clips]
+    lengths = [len(clip) for clip in clips]
+    if min(lengths) == 0:
+        raise ValueError("every clip needs at least one frame")
+
+    offsets = np.cumsum([0] + lengths[:-1])
+    edge_index = np.concatenate([temporal_edge_index(length, window_edges) + offset
+                                 for length, offset in zip(lengths, offsets)], axis=1)
+    batch = np.repeat(np.arange(len(clips), dtype=np.int64), lengths)
+    return np.concatenate(clips), edge_index, batch
+
+SLOT_INDEX = {slot: i for i, slot in enumerate(SLOT_NAMES)}
+
+def select_slots(slots):
+    """Validated slot selection in SLOT_NAMES order, or None for all slots
+
+    Accepts a list of names or a comma-separated string and raises
+    ValueError for unknown or empty selections.
+    """
+    if slots is None:
+        return None
+    if isinstance(slots, str):
+        slots = [slot.strip() for slot in slots.split(',') if slot.strip()]
+    if not slots:
+        raise ValueError("slots must name at least one slot")
+    unknown = sorted(set(slots) - set(SLOT_NAMES))
+    if unknown:
+        raise ValueError(f"Unknown slots {unknown}, expected some of {SLOT_NAMES}")
+    selected = [slot for slot in SLOT_NAMES if slot in slots]
+    return None if len(selected) == len(SLOT_NAMES) else selected
+
+# (slots, max classes) label lookup, indexed as LABEL_TABLE[slot, class]
+LABEL_TABLE = np.array([CLASS_MAPPINGS[slot] + [''] * (3 - len(CLASS_MAPPINGS[slot]))
+                        for slot in SLOT_NAMES], dtype=object)
+
+class SlotPredictions:
+    """Compact predictions for N poses
+
+    `classes` holds (N, S) predicted class indices and `confidences` the
+    matching (N, S) softmax probabilities, with columns in `slot_names` order.
+    Labels are only materialized when the results are serialized.
+    """
+    __slots__ = ('classes', 'confidences', 'slot_names')
+
+    def __init__(self, classes, confidences, slot_names=SLOT_NAMES):
+        self.classes = classes
+        self.confidences = confidences
+        self.slot_names = slot_names
+
+    @classmethod
+    def empty(cls, slot_names=SLOT_NAMES):
+        return cls(np.empty((0, len(slot_names)), dtype=np.int64),
+                   np.empty((0, len(slot_names)), dtype=np.float32), slot_names)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def labels(self):
+        """(N, S) array of predicted label strings"""
+        rows = [SLOT_INDEX[slot] for slot in self.slot_names]
+        return LABEL_TABLE[rows, self.classes]
+
+    def to_dicts(self):
+        """Per-pose {slot: {'prediction', 'confidence'}} dicts for JSON responses"""
+        slots = self.slot_names
+        return [{slot: {'prediction': label, 'confidence': confidence}
+                 for slot, label, confidence in zip(slots, label_row, confidence_row)}
+                for label_row, confidence_row in zip(self.labels().tolist(), self.confidences.tolist())]
+
+def group_logits(predictions):
+    """Stack a slot -> (N, C) logits dict into [(slots, (G, N, C) logits), ...] by class count"""
+    groups = {}
+    for slot, logits in predictions.items():
+        groups.setdefault(logits.shape[1], []).append(slot)
+    return [(slots, np.stack([predictions[slot] for slot in slots])) for slots in groups.values()]
+
+def summarize_groups(groups, slot_names=SLOT_NAMES):
+    """SlotPredictions from grouped (G, N, C) logits, one softmax per group"""
+    count = groups[0][1].shape[1]
+    columns = {slot: i for i, slot in enumerate(slot_names)}
+    classes = np.empty((count, len(slot_names)), dtype=np.int64)
+    confidences = np.empty((count, len(slot_names)), dtype=np.float32)
+    for slots, logits in groups:
+        index = [columns[slot] for slot in slots]
+        # The arg-max class has exp(0) = 1, so its probability is 1 / sum
+        shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        classes[:, index] = shifted.argmax(axis=-1).T
+        confidences[:, index] = (1.0 / shifted.sum(axis=-1)).T
+    return SlotPredictions(classes, confidences, slot_names)
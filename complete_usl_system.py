@@ -5,10 +5,12 @@ import json
 import threading
 from tkinter import font
 import cv2
-import mediapipe as mp
 import numpy as np
 from PIL import Image, ImageTk
 import os
+import collections
+import functools
+import queue
 from datetime import datetime
 import time
 import streamlit as st
@@ -20,6 +22,72 @@ from datetime import datetime
 import time
 import threading
 from streamlit.components.v1 import html
+from landmark_pipeline import POSE_FOUND, LandmarkPipeline, extract_sequence, image_features
+
+# Landmarker processes, leaving a core each for capture and the UI
+LANDMARK_WORKERS = min(3, max(1, (os.cpu_count() or 2) - 2))
+# Weights for in-process inference, loaded on a background thread at startup
+LOCAL_WEIGHTS = os.environ.get('CLINICAL_GAT_WEIGHTS',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clinical_gat_weights.pth'))
+
+class UIChannel:
+    """Thread-safe channel for widget updates, applied on the Tk thread once per tick
+    
+    Any thread may post log lines, widget options or calls; Tk itself is
+    only touched by drain(), which root.after runs every `interval_ms`.
+    A tick inserts each widget's pending log lines in one go, applies only
+    the newest options per widget, and trims logs to their last `max_lines`.
+    An update that raises is reported to `on_error` and the rest still run.
+    """
+    def __init__(self, root, interval_ms=50, max_lines=500, on_error=print):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.max_lines = max_lines
+        self.on_error = on_error
+        self.queue = queue.SimpleQueue()
+    
+    def log(self, widget, line):
+        self.queue.put(('log', widget, line))
+    
+    def set(self, widget, **options):
+        self.queue.put(('config', widget, options))
+    
+    def call(self, fn, *args):
+        self.queue.put(('call', fn, args))
+    
+    def start(self):
+        self.root.after(self.interval_ms, self.drain)
+    
+    def drain(self):
+        calls, configs, logs = [], {}, {}
+        try:
+            while True:
+                kind, target, value = self.queue.get_nowait()
+                if kind == 'log':
+                    logs.setdefault(target, collections.deque(maxlen=self.max_lines)).append(value)
+                elif kind == 'config':
+                    configs.setdefault(target, {}).update(value)
+                else:
+                    calls.append((target, value))
+        except queue.Empty:
+            pass
+        # Each update runs on its own, so one that raises cannot drop the others
+        updates = [(getattr(fn, '__name__', 'call'), functools.partial(fn, *args)) for fn, args in calls]
+        updates += [('config', functools.partial(widget.config, **options)) for widget, options in configs.items()]
+        updates += [('log', functools.partial(self.append, widget, lines)) for widget, lines in logs.items()]
+        for name, update in updates:
+            try:
+                update()
+            except Exception as e:
+                self.on_error(f"❌ UI update {name} failed: {e}")
+        self.root.after(self.interval_ms, self.drain)
+    
+    def append(self, widget, lines):
+        widget.insert(tk.END, ''.join(lines))
+        excess = int(widget.index('end-1c').split('.')[0]) - 1 - self.max_lines
+        if excess > 0:
+            widget.delete('1.0', f'{excess + 1}.0')
+        widget.see(tk.END)
 
 class CompleteUSLSystem:
     def __init__(self, root):
@@ -28,13 +96,17 @@ class CompleteUSLSystem:
         self.root.state('zoomed')
         self.root.configure(bg='#0f172a')
         
-        # Initialize MediaPipe components
-        self.mp_pose = mp.solutions.pose
-        self.mp_hands = mp.solutions.hands
-        self.mp_face = mp.solutions.face_mesh
-        self.pose = self.mp_pose.Pose(static_image_mode=False, min_detection_confidence=0.7)
-        self.hands = self.mp_hands.Hands(static_image_mode=False, max_num_hands=2, min_detection_confidence=0.7)
-        self.face_mesh = self.mp_face.FaceMesh(static_image_mode=False, max_num_faces=1, min_detection_confidence=0.7)
+        # Capture -> landmark -> feature pipeline, run in worker processes
+        # while the camera is on so MediaPipe never blocks the Tk thread
+        self.pipeline = None
+        self.media_path = None
+        self.media_kind = None
+        
+        # In-process Clinical GAT; the remote API is only a fallback for when
+        # it cannot be loaded and "Offline-first" is unticked
+        self.engine = None
+        self.engine_error = None
+        self.engine_ready = threading.Event()
         
         # Fonts
         self.fonts = {
@@ -80,8 +152,13 @@ class CompleteUSLSystem:
             "nms_signals": ["brow_raise", "head_tilt", "mouth_gestures", "eye_gaze"]
         }
         
+        # Worker threads post UI updates here instead of touching Tk
+        self.ui = UIChannel(self.root, on_error=self.update_processing_log)
+        
         self.setup_styles()
         self.create_main_layout()
+        self.ui.start()
+        self.load_local_model()
         self.start_system_monitoring()
     
     def setup_styles(self):
@@ -678,23 +755,51 @@ class CompleteUSLSystem:
             self.stop_camera()
     
     def start_camera(self):
+        try:
+            self.pipeline = LandmarkPipeline(source=0, workers=LANDMARK_WORKERS).start()
+        except Exception as e:
+            self.pipeline = None
+            self.update_status(f"❌ Camera pipeline failed: {str(e)}")
+            return
         self.live_camera_active = True
         self.camera_btn.config(text="⏹️ Stop Camera")
+        self.process_btn.config(state='normal')
         self.update_status("📹 Live camera started - Real-time USL processing active")
-        self.update_processing_log("📹 Camera activated - Streaming USL video")
+        self.update_processing_log(f"📹 Camera activated - {LANDMARK_WORKERS} landmarker process(es)")
+        self.root.after(500, self.poll_pipeline)
     
     def stop_camera(self):
         self.live_camera_active = False
+        if self.pipeline is not None:
+            # Joining the worker processes can take a moment, so do it off the Tk thread
+            threading.Thread(target=self.pipeline.stop, daemon=True).start()
+            self.pipeline = None
         self.camera_btn.config(text="📹 Live Camera (Front+Side)")
+        self.fps_label.config(text="FPS: 0")
         self.update_status("📹 Camera stopped")
         self.update_processing_log("⏹️ Camera deactivated")
     
+    def poll_pipeline(self):
+        """Show the pipeline's measured FPS and capture-to-features latency"""
+        if not self.live_camera_active or self.pipeline is None:
+            return
+        if not self.pipeline.workers_alive():
+            self.update_processing_log("❌ Landmarker processes exited - is MediaPipe installed?")
+            self.stop_camera()
+            return
+        stats = self.pipeline.stats()
+        self.fps_label.config(text=f"FPS: {stats['fps']:.1f}")
+        if stats['latency_ms'] is not None:
+            self.latency_status.config(text=f"⚡ Latency: {stats['latency_ms']:.0f}ms")
+        self.root.after(500, self.poll_pipeline)
+    
     def upload_video(self):
         file_path = filedialog.askopenfilename(
             title="Select USL Video File",
             filetypes=[("Video files", "*.mp4 *.avi *.mov *.mkv"), ("All files", "*.*")]
         )
         if file_path:
+            self.media_path, self.media_kind = file_path, 'video'
             self.process_btn.config(state='normal')
             self.update_status(f"📹 USL video loaded: {os.path.basename(file_path)}")
             self.update_processing_log(f"📁 Video uploaded: {os.path.basename(file_path)}")
@@ -705,57 +810,100 @@ class CompleteUSLSystem:
             filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp"), ("All files", "*.*")]
         )
         if file_path:
+            self.media_path, self.media_kind = file_path, 'image'
             self.process_btn.config(state='normal')
             self.update_status(f"🖼️ USL image loaded: {os.path.basename(file_path)}")
             self.update_processing_log(f"🖼️ Image uploaded: {os.path.basename(file_path)}")
     
+    def load_local_model(self):
+        def load():
+            try:
+                from clinical_gat_inference import ClinicalGATInference
+                start = time.perf_counter()
+                engine = ClinicalGATInference(LOCAL_WEIGHTS)
+                engine.predict(np.zeros(225, dtype=np.float32))  # warm-up
+                self.engine = engine
+                self.update_processing_log(f"✅ Clinical GAT loaded for offline inference "
+                                           f"({time.perf_counter() - start:.1f}s)")
+            except Exception as e:
+                self.engine_error = str(e)
+                self.update_processing_log(f"⚠️ Offline model unavailable: {str(e)}")
+            finally:
+                self.engine_ready.set()
+        
+        threading.Thread(target=load, name='model-loader', daemon=True).start()
+    
+    def run_inference(self, endpoint, payload, offline):
+        """Predictions for a /predict or /predict_sequence payload of NumPy arrays
+        
+        Runs in-process once the local model has loaded, handing the arrays
+        straight to the engine. The remote API is only called when the model
+        failed to load and offline is False; only then is a JSON body built.
+        """
+        self.engine_ready.wait()
+        if self.engine is not None:
+            self.update_processing_log("🧠 Running Clinical GAT in-process...")
+            if endpoint == "/predict_sequence":
+                return self.engine.predict_sequence(payload["frames"])
+            return self.engine.predict(payload["pose_features"])
+        if offline:
+            raise RuntimeError(f"offline model unavailable ({self.engine_error}) - "
+                               "untick Offline-first to use the remote API")
+        
+        self.update_processing_log("🌐 Sending to remote Clinical GAT API...")
+        body = {name: values.tolist() for name, values in payload.items()}
+        response = requests.post(f"{self.api_url}{endpoint}", json=body, timeout=30)
+        if response.status_code != 200:
+            raise RuntimeError(f"Clinical analysis failed: {response.text}")
+        return response.json().get('predictions', {})
+    
     def process_usl(self):
+        offline = self.offline_mode.get()
+        
         def process():
             try:
                 self.update_status("🧠 Processing USL with Graph-Reasoned LVM...")
                 self.update_processing_log("🔄 Starting comprehensive USL analysis...")
                 
-                # Simulate processing pipeline
-                steps = [
-                    "📊 Extracting 3D skeletal pose (MediaPipe + OpenPose)",
-                    "✋ Analyzing hand trajectories (MANO)",
-                    "😊 Processing facial expressions (FLAME)",
-                    "🧠 Multistream transformer processing",
-                    "📈 Graph attention network analysis",
-                    "🎯 Bayesian calibration and confidence estimation",
-                    "🏥 Clinical slot classification",
-                    "📋 Generating FHIR-structured results"
-                ]
-                
-                for i, step in enumerate(steps):
-                    self.update_processing_log(step)
-                    time.sleep(0.3)
-                    progress = (i + 1) / len(steps) * 100
-                    self.confidence_label.config(text=f"Progress: {progress:.0f}%")
-                
-                # Generate sample features
-                features = [np.random.uniform(-1, 1) for _ in range(225)]
+                # 225-d pose + hand features from the live pipeline or the uploaded media
+                self.update_processing_log("📊 Extracting 3D skeletal pose and hand landmarks (MediaPipe)")
+                features, found = self.pipeline.latest() if self.live_camera_active and self.pipeline else (None, 0)
+                if features is None and self.media_kind == 'image':
+                    features, found = image_features(self.media_path)
+                if features is not None:
+                    if not found & POSE_FOUND:
+                        # Features without a pose are mostly zeros, which still score confidently
+                        self.update_processing_log("⚠️ No signer pose detected - keep the whole upper body in view")
+                        return
+                    endpoint, payload = "/predict", {"pose_features": features}
+                elif self.media_kind == 'video':
+                    frames = extract_sequence(self.media_path, workers=LANDMARK_WORKERS)
+                    if not len(frames):
+                        raise ValueError("no frames could be read from the video")
+                    self.update_processing_log(f"🎞️ Landmarked {len(frames)} frames")
+                    endpoint, payload = "/predict_sequence", {"frames": frames}
+                else:
+                    self.update_processing_log("⚠️ Start the camera or upload a video or image first")
+                    return
                 
-                # API call
-                self.update_processing_log("🌐 Sending to Clinical GAT model...")
-                response = requests.post(f"{self.api_url}/predict", 
-                                       json={"pose_features": features}, timeout=30)
+                start = time.perf_counter()
+                predictions = self.run_inference(endpoint, payload, offline)
+                self.update_processing_log(f"⚡ Inference: {(time.perf_counter() - start) * 1000:.0f}ms")
+                self.ui.call(self.show_results, predictions)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    self.display_clinical_results(data.get('predictions', {}))
-                    self.calculate_triage_priority(data.get('predictions', {}))
-                    self.update_processing_log("✅ USL processing completed successfully")
-                else:
-                    self.update_processing_log(f"❌ Clinical analysis failed: {response.text}")
-                    
             except Exception as e:
                 self.update_processing_log(f"❌ Processing error: {str(e)}")
             finally:
-                self.confidence_label.config(text="Confidence: Ready")
+                self.ui.set(self.confidence_label, text="Confidence: Ready")
         
         threading.Thread(target=process, daemon=True).start()
     
+    def show_results(self, predictions):
+        """Display results and triage on the Tk thread, then report success"""
+        self.display_clinical_results(predictions)
+        self.calculate_triage_priority(predictions)
+        self.update_processing_log("✅ USL processing completed successfully")
+    
     def display_clinical_results(self, predictions):
         self.fhir_results.delete(1.0, tk.END)
         
@@ -773,27 +921,24 @@ class CompleteUSLSystem:
             "component": []
         }
         
-        self.fhir_results.insert(tk.END, "📋 FHIR-STRUCTURED CLINICAL RESULTS\n")
-        self.fhir_results.insert(tk.END, "=" * 60 + "\n\n")
-        self.fhir_results.insert(tk.END, f"🆔 Resource ID: {fhir_output['id']}\n")
-        self.fhir_results.insert(tk.END, f"👤 Patient: {patient_id}\n")
-        self.fhir_results.insert(tk.END, f"📅 Timestamp: {timestamp}\n")
-        self.fhir_results.insert(tk.END, f"🏥 Status: {fhir_output['status']}\n\n")
-        
-        self.fhir_results.insert(tk.END, "🩺 CLINICAL OBSERVATIONS:\n")
-        self.fhir_results.insert(tk.END, "-" * 40 + "\n")
+        # Built as line lists and inserted once per widget
+        fhir_lines = [
+            "📋 FHIR-STRUCTURED CLINICAL RESULTS",
+            "=" * 60 + "\n",
+            f"🆔 Resource ID: {fhir_output['id']}",
+            f"👤 Patient: {patient_id}",
+            f"📅 Timestamp: {timestamp}",
+            f"🏥 Status: {fhir_output['status']}\n",
+            "🩺 CLINICAL OBSERVATIONS:",
+            "-" * 40
+        ]
+        recognition_lines = ["🤟 USL RECOGNITION RESULTS", "=" * 40 + "\n"]
         
         symptom_icons = {
             'fever': '🌡️', 'cough': '😷', 'hemoptysis': '🩸', 'diarrhea': '💊',
             'duration': '⏱️', 'severity': '📊', 'travel': '✈️', 'exposure': '👥'
         }
         
-        # Update recognition results for USL→Text direction
-        if self.current_mode == "patient_to_clinician":
-            self.recognition_results.delete(1.0, tk.END)
-            self.recognition_results.insert(tk.END, "🤟 USL RECOGNITION RESULTS\\n")
-            self.recognition_results.insert(tk.END, "=" * 40 + "\\n\\n")
-        
         for symptom, result in predictions.items():
             icon = symptom_icons.get(symptom, '🏥')
             prediction = result.get('prediction', 'Unknown')
@@ -801,11 +946,8 @@ class CompleteUSLSystem:
             
             status_icon = "🔴" if prediction in ['Yes', 'Severe', 'Long'] else "🟢"
             
-            self.fhir_results.insert(tk.END, f"{icon} {symptom.upper():<12}: {status_icon} {prediction:<8} ({confidence:5.1f}%)\n")
-            
-            # Add to recognition results
-            if self.current_mode == "patient_to_clinician":
-                self.recognition_results.insert(tk.END, f"{icon} {symptom}: {prediction} (confidence: {confidence:.1f}%)\\n")
+            fhir_lines.append(f"{icon} {symptom.upper():<12}: {status_icon} {prediction:<8} ({confidence:5.1f}%)")
+            recognition_lines.append(f"{icon} {symptom}: {prediction} (confidence: {confidence:.1f}%)")
             
             # Add to FHIR structure
             fhir_output["component"].append({
@@ -814,9 +956,16 @@ class CompleteUSLSystem:
                 "extension": [{"url": "confidence", "valueDecimal": confidence/100}]
             })
         
-        self.fhir_results.insert(tk.END, "\n" + "=" * 60 + "\n")
-        self.fhir_results.insert(tk.END, "✅ Clinical screening completed\n")
-        self.fhir_results.insert(tk.END, "📊 Results ready for clinical review\n")
+        # Kept for generate_fhir_report
+        self.last_fhir_observation = fhir_output
+        
+        fhir_lines += ["\n" + "=" * 60, "✅ Clinical screening completed", "📊 Results ready for clinical review"]
+        self.fhir_results.insert(tk.END, "\n".join(fhir_lines) + "\n")
+        
+        # Update recognition results for USL→Text direction
+        if self.current_mode == "patient_to_clinician":
+            self.recognition_results.delete(1.0, tk.END)
+            self.recognition_results.insert(tk.END, "\n".join(recognition_lines) + "\n")
     
     def calculate_triage_priority(self, predictions):
         total_score = 0
@@ -877,17 +1026,23 @@ class CompleteUSLSystem:
     
     def test_api(self):
         def test():
+            if self.engine is not None:
+                self.update_processing_log(f"✅ Offline model: {self.engine.version}")
+            elif self.engine_ready.is_set():
+                self.update_processing_log(f"⚠️ Offline model unavailable: {self.engine_error}")
+            else:
+                self.update_processing_log("🔄 Offline model still loading...")
             try:
                 self.update_status("🔄 Testing Clinical GAT API connection...")
                 response = requests.get(f"{self.api_url}/health", timeout=10)
                 data = response.json()
                 
-                self.system_status.config(text="🟢 All Systems Online", fg='#22c55e')
+                self.ui.set(self.system_status, text="🟢 All Systems Online", fg='#22c55e')
                 self.update_status(f"✅ API Status: {data.get('status', 'Unknown')}")
                 self.update_processing_log(f"✅ API Health Check: {data.get('model', 'Unknown')}")
                 
             except Exception as e:
-                self.system_status.config(text="🔴 System Offline", fg='#dc2626')
+                self.ui.set(self.system_status, text="🔴 System Offline", fg='#dc2626')
                 self.update_status(f"❌ API connection failed: {str(e)}")
                 self.update_processing_log(f"❌ API Error: {str(e)}")
         
@@ -915,15 +1070,29 @@ class CompleteUSLSystem:
         self.update_processing_log("📞 Clinician notification: Sent successfully")
     
     def generate_fhir_report(self):
+        observation = getattr(self, 'last_fhir_observation', None)
+        if observation is None:
+            messagebox.showwarning("No Results", "Process a USL screening before generating a FHIR report")
+            return
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         patient_id = self.patient_id_entry.get() or "UNKNOWN"
-        filename = f"USL_Clinical_Report_{patient_id}_{timestamp}.json"
+        filename = filedialog.asksaveasfilename(initialfile=f"USL_Clinical_Report_{patient_id}_{timestamp}.json",
+                                                defaultextension=".json",
+                                                filetypes=[("FHIR JSON", "*.json")])
+        if not filename:
+            return
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(observation, f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            messagebox.showerror("Report Failed", f"Could not write {filename}:\n{e}")
+            return
         
         messagebox.showinfo("📄 FHIR Report Generated", 
                            f"Clinical report generated successfully\n\n"
                            f"📁 Filename: {filename}\n"
                            f"📋 Format: FHIR R4 Observation Resource\n"
-                           f"🔒 Encryption: AES-256\n"
                            f"📤 Status: Ready for EHR integration\n"
                            f"🏥 Compliance: WHO/MoH standards")
         self.update_status(f"📄 FHIR report generated: {filename}")
@@ -952,6 +1121,7 @@ class CompleteUSLSystem:
         
         # Clear text areas
         self.fhir_results.delete(1.0, tk.END)
+        self.last_fhir_observation = None
         self.recognition_results.delete(1.0, tk.END)
         self.text_to_usl_input.delete(1.0, tk.END)
         
@@ -970,16 +1140,9 @@ class CompleteUSLSystem:
     def start_system_monitoring(self):
         def monitor():
             while True:
-                # Update real-time metrics
-                latency = np.random.uniform(200, 300)
-                self.latency_status.config(text=f"⚡ Latency: {latency:.0f}ms")
-                
-                fps = np.random.uniform(25, 30) if self.live_camera_active else 0
-                self.fps_label.config(text=f"FPS: {fps:.1f}")
-                
-                confidence = np.random.uniform(85, 95)
+                # FPS and latency are measured by poll_pipeline while the camera runs
                 if not self.live_camera_active:
-                    self.confidence_label.config(text="Confidence: Ready")
+                    self.ui.set(self.confidence_label, text="Confidence: Ready")
                 
                 time.sleep(2)
         
@@ -991,14 +1154,11 @@ class CompleteUSLSystem:
         self.root.after(1000, self.update_time)
     
     def update_status(self, message):
-        self.status_label.config(text=message)
-        self.root.update()
+        self.ui.set(self.status_label, text=message)
     
     def update_processing_log(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.processing_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.processing_text.see(tk.END)
-        self.root.update()
+        self.ui.log(self.processing_text, f"[{timestamp}] {message}\n")
     
     def update_analytics_display(self):
         self.analytics_text.delete(1.0, tk.END)
@@ -0,0 +1,94 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from clinical_slots import CLASS_MAPPINGS
+
+# FHIR R4 output for screening results. Every fixed part of an Observation
+# is rendered to a JSON fragment once at import, so each screening only
+# joins its labels, confidences and ids into precompiled templates, and a
+# Bundle is produced piece by piece instead of as one in-memory document.
+FHIR_JSON = 'application/fhir+json'
+CONFIDENCE_EXTENSION = 'urn:usl-clinical-gat:confidence'
+OBSERVATION_CATEGORY = [{"coding": [{"system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                                     "code": "survey"}]}]
+OBSERVATION_CODE = {"text": "USL clinical symptom screening"}
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+_OBSERVATION_START = '{"resourceType":"Observation","id":"'
+_OBSERVATION_FIXED = (f'","status":"final","category":{_dumps(OBSERVATION_CATEGORY)},'
+                      f'"code":{_dumps(OBSERVATION_CODE)},')
+# slot -> label -> component up to its confidence value
+_COMPONENTS = {slot: {label: (f'{{"code":{{"text":{_dumps(slot)}}},"valueString":{_dumps(label)},'
+                              f'"extension":[{{"url":{_dumps(CONFIDENCE_EXTENSION)},"valueDecimal":')
+                      for label in labels}
+               for slot, labels in CLASS_MAPPINGS.items()}
+_COMPONENT_END = '}]}'
+
+def timestamp():
+    """Current UTC time as a FHIR dateTime"""
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+def _context(effective, model_version):
+    """The effectiveDateTime and device fragment shared by every Observation of a request"""
+    device = f"Clinical GAT {model_version or 'unknown'}"
+    return f'"effectiveDateTime":{_dumps(effective or timestamp())},"device":{{"display":{_dumps(device)}}},'
+
+def _subject(patient_id):
+    return f'"subject":{{"reference":{_dumps(f"Patient/{patient_id}")}}},' if patient_id else ''
+
+def _observation(resource_id, subject, context, slots, labels, confidences):
+    components = ','.join(_COMPONENTS[slot][label] + repr(confidence) + _COMPONENT_END
+                          for slot, label, confidence in zip(slots, labels, confidences))
+    return f'{_OBSERVATION_START}{resource_id}{_OBSERVATION_FIXED}{subject}{context}"component":[{components}]}}'
+
+def observation(results, patient_id=None, model_version=None, effective=None):
+    """Observation JSON for one pose's {slot: {'prediction', 'confidence'}} results"""
+    return _observation(uuid.uuid4(), _subject(patient_id), _context(effective, model_version), list(results),
+                        [result['prediction'] for result in results.values()],
+                        [result['confidence'] for result in results.values()])
+
+def observations(predictions, patient_ids=None, model_version=None, effective=None):
+    """(resource id, Observation JSON) for each pose of a SlotPredictions"""
+    if patient_ids is not None and len(patient_ids) != len(predictions):
+        raise ValueError(f"got {len(patient_ids)} patient_ids for {len(predictions)} poses")
+    context = _context(effective, model_version)
+    slots = predictions.slot_names
+    patient_ids = patient_ids if patient_ids is not None else [None] * len(predictions)
+    for patient_id, labels, confidences in zip(patient_ids, predictions.labels().tolist(),
+                                               predictions.confidences.tolist()):
+        resource_id = uuid.uuid4()
+        yield resource_id, _observation(resource_id, _subject(patient_id), context, slots, labels, confidences)
+
+def ndjson_observations(predictions, patient_ids=None, model_version=None, effective=None):
+    """NDJSON bytes with one Observation per pose, as in FHIR bulk data exports"""
+    return ''.join(resource + '\n' for _, resource
+                   in observations(predictions, patient_ids, model_version, effective)).encode('utf-8')
+
+def bundle_start(effective=None):
+    """Opening bytes of a collection Bundle, up to its first entry"""
+    return (f'{{"resourceType":"Bundle","id":"{uuid.uuid4()}","type":"collection",'
+            f'"timestamp":{_dumps(effective or timestamp())},"entry":[').encode('utf-8')
+
+def bundle_entries(predictions, patient_ids=None, model_version=None, effective=None, first=True):
+    """Bundle entry bytes for each pose of a SlotPredictions, led by a comma unless `first`"""
+    entries = ','.join(f'{{"fullUrl":"urn:uuid:{resource_id}","resource":{resource}}}' for resource_id, resource
+                       in observations(predictions, patient_ids, model_version, effective))
+    return (entries if first else ',' + entries).encode('utf-8')
+
+BUNDLE_END = b']}'
+
+def bundle(batches, model_version=None):
+    """Yield a collection Bundle as UTF-8 pieces, one per (SlotPredictions, patient_ids) batch
+
+    `batches` may be a generator, so only one batch of entries is in memory.
+    """
+    effective = timestamp()
+    yield bundle_start(effective)
+    first = True
+    for predictions, patient_ids in batches:
+        if len(predictions):
+            yield bundle_entries(predictions, patient_ids, model_version, effective, first)
+            first = False
+    yield BUNDLE_END
@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+
+# Pre-fork serving: the master imports app.py once (loading and warming the
+# model) and workers fork from it, sharing the weights copy-on-write
+preload_app = True
+os.environ.setdefault('CLINICAL_GAT_PREFORK', '1')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = 120
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+def inference_threads_per_worker():
+    """Split the cores between workers unless INFERENCE_THREADS overrides it"""
+    configured = os.environ.get('INFERENCE_THREADS')
+    if configured:
+        return int(configured)
+    return max(1, available_cores() // workers)
+
+def post_fork(server, worker):
+    from app import set_inference_threads
+
+    num_threads = inference_threads_per_worker()
+    set_inference_threads(num_threads)
+    server.log.info(f"Worker {worker.pid}: {num_threads} inference thread(s)")
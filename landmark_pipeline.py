@@ -0,0 +1,514 @@
+import argparse
+import collections
+import math
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from clinical_slots import NUM_FEATURES
+
+# Capture -> landmark -> feature pipeline for the desktop app:
+#
+#   capture process --frame ring--> landmarker workers --landmark ring--> assembler thread
+#
+# The rings are fixed-size slots in shared memory, so frames and landmarks
+# cross process boundaries without pickling. Live sources keep only the
+# newest frame: a slow stage skips ahead instead of building a backlog, and
+# every skipped frame is counted as dropped. File sources block instead, so
+# every frame is landmarked. Workers are spawned, never forked, so they do
+# not inherit the Tk process.
+
+# 225-d feature layout: 33 pose then 21 left-hand and 21 right-hand landmarks, x/y/z each
+POSE_LANDMARKS = 33
+HAND_LANDMARKS = 21
+POSE = slice(0, POSE_LANDMARKS)
+LEFT_HAND = slice(POSE_LANDMARKS, POSE_LANDMARKS + HAND_LANDMARKS)
+RIGHT_HAND = slice(POSE_LANDMARKS + HAND_LANDMARKS, POSE_LANDMARKS + 2 * HAND_LANDMARKS)
+NUM_LANDMARKS = POSE_LANDMARKS + 2 * HAND_LANDMARKS
+assert NUM_LANDMARKS * 3 == NUM_FEATURES
+
+# Presence bits stored with each landmark slot
+POSE_FOUND, LEFT_FOUND, RIGHT_FOUND = 1, 2, 4
+
+# Ring header fields
+_WRITE, _READ, _DROPPED = range(3)
+# Per-slot metadata: frame index, capture time (perf_counter), stage-specific value
+META_FIELDS = 3
+
+def _attach(name):
+    """Attach to a block created by the parent, leaving its cleanup to the parent"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers, but spawned children share the
+        # parent's resource tracker, so this only repeats its registration
+        return shared_memory.SharedMemory(name=name)
+
+class SharedRing:
+    """Ring of `capacity` fixed-shape slots in one shared memory block
+
+    put() reserves the next slot, fills it and publishes it; a full ring
+    overwrites its oldest unread slot (counted as dropped) unless `block`
+    is set, in which case it also waits for readers still copying the slot.
+    get() copies the newest unread slot and drops the older ones, or takes
+    the oldest with latest=False. Each slot carries a sequence number that
+    is cleared while it is written, so a reader that lost a race with an
+    overwriting writer discards its copy instead of returning a torn frame.
+    """
+    def __init__(self, shape, dtype, capacity, context=None):
+        context = context or multiprocessing.get_context('spawn')
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.condition = context.Condition()
+        self.shm = shared_memory.SharedMemory(create=True, size=self._size())
+        self.owner = True
+        self._map()
+        self.header[:] = 0
+        self.seqs[:] = -1
+        self.busy[:] = 0
+
+    def _size(self):
+        slot_bytes = math.prod(self.shape) * self.dtype.itemsize
+        return 8 * (4 + 2 * self.capacity + self.capacity * META_FIELDS) + self.capacity * slot_bytes
+
+    def _map(self):
+        buffer = self.shm.buf
+        offset = 0
+        def view(dtype, shape):
+            nonlocal offset
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            offset += array.nbytes
+            return array
+        self.header = view(np.int64, (4,))
+        self.seqs = view(np.int64, (self.capacity,))
+        self.busy = view(np.int64, (self.capacity,))  # readers copying each slot
+        self.meta = view(np.float64, (self.capacity, META_FIELDS))
+        self.data = view(self.dtype, (self.capacity,) + self.shape)
+
+    def __getstate__(self):
+        return {'shape': self.shape, 'dtype': self.dtype.str, 'capacity': self.capacity,
+                'condition': self.condition, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.dtype = np.dtype(state['dtype'])
+        self.capacity = state['capacity']
+        self.condition = state['condition']
+        self.shm = _attach(state['name'])
+        self.owner = False
+        self._map()
+
+    def put(self, data, meta, block=False, timeout=None):
+        """Write one slot; returns False if `block` timed out waiting for room"""
+        with self.condition:
+            if block and not self.condition.wait_for(
+                    lambda: (self.header[_WRITE] - self.header[_READ] < self.capacity
+                             and not self.busy[self.header[_WRITE] % self.capacity]), timeout):
+                return False
+            seq = int(self.header[_WRITE])
+            self.header[_WRITE] = seq + 1
+            if seq - self.header[_READ] >= self.capacity:
+                # Overwrite the oldest unread slot
+                self.header[_READ] = seq - self.capacity + 1
+                self.header[_DROPPED] += 1
+            slot = seq % self.capacity
+            self.seqs[slot] = -1
+        np.copyto(self.data[slot], data, casting='unsafe')
+        self.meta[slot] = meta
+        with self.condition:
+            self.seqs[slot] = seq
+            self.condition.notify_all()
+        return True
+
+    def get(self, out, timeout=None, latest=True):
+        """Copy an unread slot into `out` and return its metadata, or None on timeout"""
+        with self.condition:
+            def ready():
+                write, read = int(self.header[_WRITE]), int(self.header[_READ])
+                if write <= read:
+                    return None
+                seq = write - 1 if latest else read
+                return seq if self.seqs[seq % self.capacity] == seq else None
+            seq = ready()
+            if seq is None:
+                if not self.condition.wait_for(lambda: ready() is not None, timeout):
+                    return None
+                seq = ready()
+            self.header[_DROPPED] += seq - self.header[_READ]
+            self.header[_READ] = seq + 1
+            slot = seq % self.capacity
+            meta = self.meta[slot].copy()
+            self.busy[slot] += 1
+        np.copyto(out, self.data[slot])
+        with self.condition:
+            self.busy[slot] -= 1
+            self.condition.notify_all()
+            if self.seqs[slot] != seq:
+                # Overwritten while copying
+                self.header[_DROPPED] += 1
+                return None
+        return meta
+
+    def counters(self):
+        """(written, dropped) slot counts"""
+        return int(self.header[_WRITE]), int(self.header[_DROPPED])
+
+    def close(self):
+        del self.header, self.seqs, self.busy, self.meta, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def landmark_array(landmarks):
+    """(n, 3) float32 x/y/z array from a MediaPipe NormalizedLandmarkList"""
+    return np.array([(point.x, point.y, point.z) for point in landmarks.landmark], dtype=np.float32)
+
+class SolutionsLandmarker:
+    """MediaPipe Pose and Hands solutions run one after the other on each RGB frame
+
+    Returns (75, 3) landmarks in the feature layout plus presence bits;
+    missing parts stay zero. MediaPipe labels hands as if the image were
+    mirrored, so unmirrored camera frames swap the labels to the signer's
+    own left and right.
+    """
+    def __init__(self, min_detection_confidence=0.7, mirrored=False):
+        import mediapipe as mp
+
+        self.pose = mp.solutions.pose.Pose(static_image_mode=False,
+                                           min_detection_confidence=min_detection_confidence)
+        self.hands = mp.solutions.hands.Hands(static_image_mode=False, max_num_hands=2,
+                                              min_detection_confidence=min_detection_confidence)
+        self.mirrored = mirrored
+
+    def __call__(self, rgb):
+        points = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)
+        found = 0
+        rgb.flags.writeable = False
+        pose = self.pose.process(rgb)
+        if pose.pose_landmarks:
+            points[POSE] = landmark_array(pose.pose_landmarks)
+            found |= POSE_FOUND
+        hands = self.hands.process(rgb)
+        for landmarks, handedness in zip(hands.multi_hand_landmarks or [], hands.multi_handedness or []):
+            left = (handedness.classification[0].label == 'Left') == self.mirrored
+            points[LEFT_HAND if left else RIGHT_HAND] = landmark_array(landmarks)
+            found |= LEFT_FOUND if left else RIGHT_FOUND
+        rgb.flags.writeable = True
+        return points, found
+
+    def close(self):
+        self.pose.close()
+        self.hands.close()
+
+class HolisticLandmarker:
+    """One MediaPipe Holistic pass per frame on a downscaled crop around the signer
+
+    Every `detect_every` frames, and whenever tracking is lost, a static
+    Holistic instance runs full detection on the whole frame, and the box
+    around the detected landmarks plus `margin` becomes the region of
+    interest. The frames in between only pass that crop to a tracking-mode
+    Holistic instance. The crop stays fixed until the next detection, so
+    its landmark tracking keeps a stable coordinate frame. Inputs are
+    downscaled so their longer side is at most `max_side`, and landmarks
+    are mapped back to whole-frame coordinates. Holistic finds each hand
+    from the matching pose wrist, so its labels are already the signer's.
+    """
+    def __init__(self, detect_every=10, max_side=320, margin=0.3, model_complexity=0,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        import cv2
+        import mediapipe as mp
+
+        self.cv2 = cv2
+        holistic = mp.solutions.holistic.Holistic
+        self.detector = holistic(static_image_mode=True, model_complexity=model_complexity,
+                                 min_detection_confidence=min_detection_confidence)
+        self.tracker = holistic(static_image_mode=False, model_complexity=model_complexity,
+                                min_detection_confidence=min_detection_confidence,
+                                min_tracking_confidence=min_tracking_confidence)
+        self.detect_every = detect_every
+        self.max_side = max_side
+        self.margin = margin
+        self.roi = None  # (x0, y0, x1, y1) pixels of the tracked crop
+        self.since_detection = 0
+        self.detections = 0
+
+    def _downscale(self, image):
+        height, width = image.shape[:2]
+        scale = self.max_side / max(height, width) if self.max_side else 1.0
+        if scale >= 1.0:
+            return np.ascontiguousarray(image)
+        return self.cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                               interpolation=self.cv2.INTER_AREA)
+
+    def _landmarks(self, results, box, width, height):
+        """(75, 3) whole-frame landmarks and presence bits from results on the `box` crop"""
+        x0, y0, x1, y1 = box
+        scale = np.array([(x1 - x0) / width, (y1 - y0) / height, (x1 - x0) / width], dtype=np.float32)
+        offset = np.array([x0 / width, y0 / height, 0.0], dtype=np.float32)
+        points = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)
+        found = 0
+        for part, landmarks, bit in ((POSE, results.pose_landmarks, POSE_FOUND),
+                                     (LEFT_HAND, results.left_hand_landmarks, LEFT_FOUND),
+                                     (RIGHT_HAND, results.right_hand_landmarks, RIGHT_FOUND)):
+            if landmarks:
+                points[part] = landmark_array(landmarks) * scale + offset
+                found |= bit
+        return points, found
+
+    def _region(self, points, found, width, height):
+        """Pixel box around the found landmarks plus the margin, or None without a pose"""
+        if not found & POSE_FOUND:
+            return None
+        parts = [points[POSE]]
+        if found & LEFT_FOUND:
+            parts.append(points[LEFT_HAND])
+        if found & RIGHT_FOUND:
+            parts.append(points[RIGHT_HAND])
+        xy = np.concatenate(parts)[:, :2]
+        low, high = xy.min(axis=0), xy.max(axis=0)
+        pad = (high - low) * self.margin
+        x0, y0 = np.clip((low - pad) * (width, height), 0, (width, height)).astype(int)
+        x1, y1 = np.clip((high + pad) * (width, height), 0, (width, height)).astype(int)
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            return None
+        return int(x0), int(y0), int(x1), int(y1)
+
+    def __call__(self, rgb):
+        height, width = rgb.shape[:2]
+        if self.roi is None or self.since_detection >= self.detect_every:
+            box = (0, 0, width, height)
+            results = self.detector.process(self._downscale(rgb))
+            self.since_detection = 0
+            self.detections += 1
+        else:
+            box = self.roi
+            x0, y0, x1, y1 = box
+            results = self.tracker.process(self._downscale(rgb[y0:y1, x0:x1]))
+            self.since_detection += 1
+        points, found = self._landmarks(results, box, width, height)
+        if box[2:] == (width, height) and box[:2] == (0, 0):
+            self.roi = self._region(points, found, width, height)
+        elif not found & POSE_FOUND:
+            self.roi = None  # lost the signer: detect on the next frame
+        return points, found
+
+    def close(self):
+        self.detector.close()
+        self.tracker.close()
+
+def _capture(source, frames, stop, ended, realtime):
+    """Capture process: read, resize and convert frames to RGB into the frame ring"""
+    import cv2
+
+    capture = cv2.VideoCapture(source)
+    height, width = frames.shape[:2]
+    rgb = np.empty(frames.shape, dtype=np.uint8)
+    index = 0
+    try:
+        while not stop.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+            # File sources wait for room; `stop` is rechecked every 100 ms
+            while not frames.put(rgb, (index, time.perf_counter(), 0), block=not realtime, timeout=0.1):
+                if stop.is_set():
+                    return
+            index += 1
+    finally:
+        capture.release()
+        ended.set()
+
+def _landmark(frames, landmarks, stop, landmarker_factory, landmarker_options, realtime):
+    """Landmarker worker: frame ring -> landmarker -> landmark ring"""
+    landmarker = landmarker_factory(**landmarker_options)
+    frame = np.empty(frames.shape, dtype=frames.dtype)
+    try:
+        while not stop.is_set():
+            meta = frames.get(frame, timeout=0.1, latest=realtime)
+            if meta is None:
+                continue
+            points, found = landmarker(frame)
+            while not landmarks.put(points, (meta[0], meta[1], found), block=not realtime, timeout=0.1):
+                if stop.is_set():
+                    return
+    finally:
+        landmarker.close()
+
+class LandmarkPipeline:
+    """Capture process, landmarker worker processes and a feature assembler thread
+
+    `source` is a camera index or a video path. Live sources (`realtime`)
+    keep only the freshest frames; file sources are landmarked in full.
+    Each assembled 225-d vector is passed to on_features(features,
+    frame_index, found) on the assembler thread and kept, with its found
+    bits, as latest().
+    """
+    def __init__(self, source=0, workers=2, width=640, height=480, realtime=True,
+                 landmarker_factory=HolisticLandmarker, landmarker_options=None,
+                 on_features=None, ring_capacity=4):
+        self.source = source
+        self.workers = workers
+        self.realtime = realtime
+        self.landmarker_factory = landmarker_factory
+        self.landmarker_options = landmarker_options or {}
+        self.on_features = on_features
+        self.context = multiprocessing.get_context('spawn')
+        self.frames = SharedRing((height, width, 3), np.uint8, ring_capacity, self.context)
+        self.landmarks = SharedRing((NUM_LANDMARKS, 3), np.float32, max(ring_capacity, 2 * workers),
+                                    self.context)
+        self.stop_event = self.context.Event()
+        self.ended = self.context.Event()
+        self.processes = []
+        self.thread = None
+        self.lock = threading.Lock()
+        self.latest_features = None
+        self.latest_found = 0
+        self.last_index = -1
+        self.assembled = 0
+        self.stale = 0
+        self.latency = None
+        self.recent = collections.deque(maxlen=120)
+
+    def start(self):
+        self.processes = [self.context.Process(target=_capture, name='usl-capture', daemon=True,
+                                               args=(self.source, self.frames, self.stop_event, self.ended,
+                                                     self.realtime))]
+        self.processes += [self.context.Process(target=_landmark, name=f'usl-landmarker-{i}', daemon=True,
+                                                args=(self.frames, self.landmarks, self.stop_event,
+                                                      self.landmarker_factory, self.landmarker_options,
+                                                      self.realtime))
+                           for i in range(self.workers)]
+        for process in self.processes:
+            process.start()
+        self.thread = threading.Thread(target=self._assemble, name='usl-assembler', daemon=True)
+        self.thread.start()
+        return self
+
+    def _assemble(self):
+        points = np.empty((NUM_LANDMARKS, 3), dtype=np.float32)
+        while not self.stop_event.is_set():
+            meta = self.landmarks.get(points, timeout=0.1, latest=self.realtime)
+            if meta is None:
+                continue
+            index, captured, found = int(meta[0]), meta[1], int(meta[2])
+            now = time.perf_counter()
+            with self.lock:
+                if self.realtime and index <= self.last_index:
+                    # A slower worker finished an older frame after a newer one
+                    self.stale += 1
+                    continue
+                features = points.reshape(-1).copy()
+                self.latest_features, self.latest_found = features, found
+                self.last_index = max(self.last_index, index)
+                self.assembled += 1
+                self.recent.append(now)
+                latency = now - float(captured)
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+            if self.on_features is not None:
+                self.on_features(features, index, found)
+
+    def latest(self):
+        """(features, found) of the most recent frame, or (None, 0) before the first
+
+        `found` holds the POSE_FOUND/LEFT_FOUND/RIGHT_FOUND bits; missing parts
+        are zeros in the features.
+        """
+        with self.lock:
+            return self.latest_features, self.latest_found
+
+    def workers_alive(self):
+        """False once every landmarker process has exited, e.g. after a crash"""
+        return any(process.is_alive() for process in self.processes[1:])
+
+    def finished(self):
+        """True once a file source has been read and every frame assembled or dropped"""
+        if not self.ended.is_set():
+            return False
+        captured, frames_dropped = self.frames.counters()
+        _, landmarks_dropped = self.landmarks.counters()
+        with self.lock:
+            return self.assembled + self.stale + frames_dropped + landmarks_dropped >= captured
+
+    def stats(self):
+        """Measured rates over the last second or so of assembled frames"""
+        captured, frames_dropped = self.frames.counters()
+        landmarked, landmarks_dropped = self.landmarks.counters()
+        with self.lock:
+            recent = [t for t in self.recent if t > time.perf_counter() - 2.0]
+            fps = (len(recent) - 1) / (recent[-1] - recent[0]) if len(recent) > 1 and recent[-1] > recent[0] else 0.0
+            return {
+                'fps': fps,
+                'latency_ms': self.latency * 1000 if self.latency is not None else None,
+                'captured': captured,
+                'landmarked': landmarked,
+                'assembled': self.assembled,
+                'dropped': frames_dropped + landmarks_dropped + self.stale,
+            }
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.frames.close()
+        self.landmarks.close()
+
+def extract_sequence(path, workers=2, width=640, height=480, **options):
+    """(T, 225) float32 features for every frame of a video file, in frame order"""
+    collected = {}
+    def on_features(features, index, found):
+        collected[index] = features
+    pipeline = LandmarkPipeline(path, workers, width, height, realtime=False, on_features=on_features,
+                                **options).start()
+    try:
+        while not pipeline.finished():
+            if not pipeline.workers_alive():
+                raise RuntimeError("landmarker workers exited before the video was processed")
+            time.sleep(0.05)
+    finally:
+        pipeline.stop()
+    if not collected:
+        return np.empty((0, NUM_FEATURES), dtype=np.float32)
+    return np.stack([collected[index] for index in sorted(collected)])
+
+def image_features(path, landmarker_factory=HolisticLandmarker, **options):
+    """(features, found) for a single image file, like LandmarkPipeline.latest()"""
+    import cv2
+
+    frame = cv2.imread(path)
+    if frame is None:
+        raise ValueError(f"could not read image {path}")
+    landmarker = landmarker_factory(**options)
+    try:
+        points, found = landmarker(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        landmarker.close()
+    return points.reshape(-1), found
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the capture -> landmark -> feature pipeline and report FPS")
+    parser.add_argument('--source', default='0', help="camera index or video path")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    pipeline = LandmarkPipeline(source, args.workers, realtime=isinstance(source, int)).start()
+    try:
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline and not pipeline.finished():
+            time.sleep(1)
+            stats = pipeline.stats()
+            latency = f"{stats['latency_ms']:.0f} ms" if stats['latency_ms'] is not None else "-"
+            print(f"🎥 {stats['fps']:.1f} FPS, latency {latency}, "
+                  f"{stats['assembled']}/{stats['captured']} frames, {stats['dropped']} dropped")
+    finally:
+        pipeline.stop()
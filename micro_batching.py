@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """Merge concurrent single-pose requests into batched forward passes
+
+    Callers submit poses from any thread and get a Future back. A dedicated
+    inference thread takes the first queued pose, keeps collecting until it
+    has `max_batch_size` poses or `max_wait_ms` has passed, runs one
+    predict_batch() call, then resolves each caller's future with its own
+    result. If the batch fails, its poses are retried one by one so that
+    only the callers whose pose fails get the exception.
+    """
+    def __init__(self, predict_batch, max_batch_size=32, max_wait_ms=2.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.counters = {'requests': 0, 'batches': 0, 'errors': 0, 'retried_batches': 0}
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so pre-forked workers start their own
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def submit(self, pose_features):
+        """Queue one pose; the returned Future resolves to its result dict"""
+        self._ensure_started()
+        future = Future()
+        self.queue.put((pose_features, future))
+        return future
+
+    def predict(self, pose_features, timeout=None):
+        """Blocking drop-in for engine.predict"""
+        return self.submit(pose_features).result(timeout)
+
+    def close(self):
+        """Finish queued work and stop the inference thread"""
+        if self.thread is not None and self.pid == os.getpid():
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = self.pid = None
+
+    def _collect(self, first):
+        """The first item plus whatever arrives before the batch fills or the wait ends"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [(pose, future) for pose, future in self._collect(first)
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self.counters['requests'] += len(batch)
+            self.counters['batches'] += 1
+            try:
+                results = self.predict_batch([pose for pose, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    self.counters['errors'] += 1
+                    batch[0][1].set_exception(e)
+                else:
+                    self._run_each(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _run_each(self, batch):
+        """Retry a failed batch pose by pose, failing only the futures whose pose fails"""
+        self.counters['retried_batches'] += 1
+        for pose, future in batch:
+            try:
+                result = self.predict_batch([pose])[0]
+            except Exception as e:
+                self.counters['errors'] += 1
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        batches = self.counters['batches']
+        return {
+            **self.counters,
+            'mean_batch_size': self.counters['requests'] / batches if batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+        }
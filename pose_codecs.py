@@ -0,0 +1,207 @@
+import ast
+import json
+import numpy as np
+from clinical_slots import NUM_FEATURES
+
+# Binary request bodies for /predict and /batch_predict. Every format decodes
+# straight into an ndarray over the request buffer with np.frombuffer, so no
+# per-float Python objects are created; pass a bytearray body to get a
+# writable array that torch.from_numpy can wrap without copying again.
+OCTET_STREAM = 'application/octet-stream'
+NPY_TYPES = ('application/x-npy', 'application/npy')
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+BINARY_TYPES = (OCTET_STREAM,) + NPY_TYPES + MSGPACK_TYPES
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+STREAM_TYPES = NDJSON_TYPES + (OCTET_STREAM,)
+
+def is_binary(mimetype):
+    return mimetype in BINARY_TYPES
+
+def float32_rows(buffer, width=NUM_FEATURES, offset=0):
+    """View little-endian float32 bytes as (N, width) rows"""
+    count = (len(buffer) - offset) // 4
+    if count * 4 != len(buffer) - offset:
+        raise ValueError("float32 body length must be a multiple of 4 bytes")
+    if width <= 0 or count % width:
+        raise ValueError(f"float32 body holds {count} values, not a whole number of {width}-wide rows")
+    return np.frombuffer(buffer, dtype='<f4', count=count, offset=offset).reshape(-1, width)
+
+def decode_npy(buffer):
+    """ndarray over the data of a .npy file held in `buffer`"""
+    view = memoryview(buffer)
+    if bytes(view[:6]) != b'\x93NUMPY':
+        raise ValueError("body is not a .npy file")
+    major = view[6]
+    if major == 1:
+        header_len, start = int.from_bytes(view[8:10], 'little'), 10
+    elif major in (2, 3):
+        header_len, start = int.from_bytes(view[8:12], 'little'), 12
+    else:
+        raise ValueError(f"unsupported .npy version {major}")
+    try:
+        header = ast.literal_eval(bytes(view[start:start + header_len]).decode('latin1'))
+        dtype = np.dtype(header['descr'])
+        shape = tuple(int(size) for size in header['shape'])
+        order = 'F' if header['fortran_order'] else 'C'
+    except (SyntaxError, ValueError, TypeError, KeyError, MemoryError, RecursionError) as e:
+        raise ValueError(f"malformed .npy header: {e!r}") from None
+
+    if dtype.hasobject or dtype.kind not in 'fiu':
+        raise ValueError(f"unsupported .npy dtype {dtype}")
+    if any(size < 0 for size in shape):
+        raise ValueError(f"malformed .npy shape {shape}")
+    count = int(np.prod(shape))
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=start + header_len)
+    array = array.reshape(shape, order=order)
+    if array.dtype != np.float32:
+        array = array.astype(np.float32)  # only copies for non-float32 files
+    return array
+
+def decode_msgpack(buffer, key, width=NUM_FEATURES):
+    """Poses from a msgpack body
+
+    The body is either the poses themselves or a map with `key`
+    ('pose_features' or 'pose_list'), each given as raw little-endian float32
+    bytes or as nested number arrays. Raw bytes may carry an optional
+    'shape' entry.
+    """
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ValueError("msgpack request bodies require `pip install msgpack`") from e
+
+    data = msgpack.unpackb(buffer, raw=False)
+    shape = None
+    if isinstance(data, dict):
+        if key not in data:
+            raise ValueError(f"No {key} provided")
+        shape = data.get('shape')
+        data = data[key]
+    if isinstance(data, (bytes, bytearray)):
+        rows = float32_rows(data, shape[-1] if shape else width)
+        return rows.reshape(shape) if shape else rows
+    return np.asarray(data, dtype=np.float32)
+
+def decode_poses(buffer, mimetype, key, width=NUM_FEATURES):
+    """Pose array from a binary request body
+
+    Raw application/octet-stream bodies are (N, width) rows; .npy and msgpack
+    bodies keep the array's own shape, so a single pose may arrive 1-D.
+    Raises ValueError for malformed bodies.
+    """
+    if mimetype == OCTET_STREAM:
+        return float32_rows(buffer, width)
+    if mimetype in NPY_TYPES:
+        return decode_npy(buffer)
+    if mimetype in MSGPACK_TYPES:
+        return decode_msgpack(buffer, key, width)
+    raise ValueError(f"unsupported content type {mimetype}")
+
+def json_pose(value):
+    """A JSON pose_features value as a 1-D float32 array; raises ValueError"""
+    try:
+        pose = np.asarray(value, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise ValueError("pose_features must be an array of numbers") from None
+    if pose.ndim != 1:
+        raise ValueError("pose_features must be 1D array")
+    return pose
+
+def single_pose(poses):
+    """The one pose of a decoded /predict body as a 1-D array"""
+    if poses.ndim == 2 and poses.shape[0] == 1:
+        return poses[0]
+    if poses.ndim != 1:
+        raise ValueError("pose_features must be a single pose; send batches to /batch_predict")
+    return poses
+
+def pose_rows(poses):
+    """The decoded /batch_predict body as (N, F) rows"""
+    if poses.ndim != 2:
+        raise ValueError("pose_list must be a 2D array of [pose][feature]")
+    return poses
+
+class PoseStreamDecoder:
+    """Split a streamed request body into (n, F) pose batches as it arrives
+
+    NDJSON bodies carry one pose per line, either as a bare array or as
+    {"pose_features": [...]}; octet-stream bodies are back-to-back float32
+    rows of `width`. feed() returns the batches of `chunk_size` poses that
+    the new bytes completed and close() returns the final partial batch, so
+    at most one batch and one partial line/row are buffered at a time.
+    With `patient_ids`, every batch is a (poses, ids) pair instead, where ids
+    holds each NDJSON line's optional "patient_id" (None for float32 rows).
+    """
+    def __init__(self, mimetype, chunk_size=256, width=NUM_FEATURES, patient_ids=False):
+        if mimetype not in STREAM_TYPES:
+            raise ValueError(f"unsupported content type {mimetype}")
+        self.ndjson = mimetype in NDJSON_TYPES
+        self.chunk_size = chunk_size
+        self.width = width
+        self.patient_ids = patient_ids
+        self.pending = bytearray()
+        self.poses = []
+        self.ids = []
+
+    def feed(self, data):
+        self.pending += data
+        if not self.ndjson:
+            batch_bytes = self.chunk_size * self.width * 4
+            batches = []
+            while len(self.pending) >= batch_bytes:
+                batches.append(self._rows(self.pending[:batch_bytes]))
+                del self.pending[:batch_bytes]
+            return batches
+
+        end = self.pending.rfind(b'\n') + 1
+        if not end:
+            return []
+        lines = self.pending[:end].split(b'\n')
+        del self.pending[:end]
+        return self._parse_lines(lines)
+
+    def close(self):
+        if not self.ndjson:
+            batches = [self._rows(self.pending)] if self.pending else []
+        else:
+            batches = self._parse_lines([self.pending])
+            if self.poses:
+                batches.append(self._flush())
+        self.pending = bytearray()
+        return batches
+
+    def _parse_lines(self, lines):
+        batches = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                pose = json.loads(line)
+            except ValueError:
+                raise ValueError("every NDJSON line must be a JSON pose array")
+            patient_id = None
+            if isinstance(pose, dict):
+                patient_id = pose.get('patient_id')
+                pose = pose.get('pose_features')
+            if not isinstance(pose, list):
+                raise ValueError("every NDJSON line must be a pose array or {\"pose_features\": [...]}")
+            self.poses.append(pose)
+            self.ids.append(patient_id)
+            if len(self.poses) == self.chunk_size:
+                batches.append(self._flush())
+        return batches
+
+    def _rows(self, buffer):
+        rows = float32_rows(buffer, self.width)
+        return (rows, None) if self.patient_ids else rows
+
+    def _flush(self):
+        poses, self.poses = self.poses, []
+        ids, self.ids = self.ids, []
+        return (poses, ids) if self.patient_ids else poses
+
+def ndjson_predictions(predictions, start=0, model_version=None):
+    """NDJSON bytes with one {"index", "model_version", "predictions"} line per pose of a SlotPredictions"""
+    return ''.join(json.dumps({'index': index, 'model_version': model_version, 'predictions': result},
+                              separators=(',', ':')) + '\n'
+                   for index, result in enumerate(predictions.to_dicts(), start)).encode('utf-8')
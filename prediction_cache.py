@@ -0,0 +1,104 @@
+import collections
+import hashlib
+import sys
+import threading
+import time
+import numpy as np
+from clinical_slots import NUM_FEATURES, fill_pose_matrix
+
+def _deep_sizeof(obj):
+    """Approximate memory held by a result made of dicts, lists, strings and numbers"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k) + _deep_sizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_sizeof(item) for item in obj)
+    return size
+
+class PredictionCache:
+    """Bounded LRU + TTL cache of predictions for near-duplicate pose vectors
+
+    Poses are padded/truncated to 225 features and quantized to a grid of
+    step `tolerance`; poses falling in the same grid cell share one entry.
+    Entries expire after `ttl_seconds`, and the least recently used ones are
+    evicted once either `max_entries` or `max_bytes` would be exceeded.
+    """
+    def __init__(self, tolerance=1e-3, max_entries=10000, ttl_seconds=300, max_bytes=64 * 2**20):
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()  # key -> (expires_at, size, value)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def key(self, pose_features, namespace=''):
+        """Digest of the quantized, 225-wide pose vector within `namespace` (e.g. a model version)"""
+        features = fill_pose_matrix(np.asarray(pose_features, dtype=np.float32).reshape(1, -1),
+                                    np.empty((1, NUM_FEATURES), dtype=np.float32))
+        if self.tolerance > 0:
+            features = np.round(features / self.tolerance).astype(np.int64)
+        digest = hashlib.blake2b(namespace.encode('utf-8'), digest_size=16)
+        digest.update(features.tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                self.counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[2]
+
+    def put(self, key, value):
+        size = _deep_sizeof(value) + len(key)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            while self.entries and (len(self.entries) >= self.max_entries
+                                    or self.bytes + size > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.counters['evictions'] += 1
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self.bytes += size
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def get_or_compute(self, pose_features, compute, namespace=''):
+        """Cached result for `pose_features`, calling compute(pose_features) on a miss"""
+        key = self.key(pose_features, namespace)
+        value = self.get(key)
+        if value is None:
+            value = compute(pose_features)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'hit_rate': self.counters['hits'] / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'tolerance': self.tolerance,
+            }
@@ -0,0 +1,81 @@
+import numpy as np
+from clinical_slots import CLASS_MAPPINGS, LABEL_TABLE, SLOT_INDEX, SLOT_NAMES, SlotPredictions
+
+# The weighted triage rules of CompleteUSLSystem.calculate_triage_priority,
+# applied to a whole batch of predictions with array lookups instead of a
+# per-patient dict loop.
+TRIAGE_WEIGHTS = {"fever": 3, "cough": 3, "hemoptysis": 5, "diarrhea": 3,
+                  "duration": 2, "severity": 4, "travel": 2, "exposure": 2}
+POSITIVE_LABELS = ('Yes', 'Severe', 'Long')
+CRITICAL_SLOTS = ('hemoptysis',)
+MAX_SCORE = sum(TRIAGE_WEIGHTS.values())
+
+PRIORITIES = np.array(['CRITICAL', 'HIGH', 'MEDIUM', 'LOW'], dtype=object)
+PRIORITY_COLORS = np.array(['#dc2626', '#ea580c', '#d97706', '#16a34a'], dtype=object)
+RISK_LEVELS = np.array(['Critical', 'High', 'Medium', 'Low'], dtype=object)
+
+# (slots, max classes) points and critical flags for each predicted class,
+# indexed like LABEL_TABLE[slot, class]
+_positive = np.isin(LABEL_TABLE, POSITIVE_LABELS)
+SCORE_TABLE = _positive * np.array([TRIAGE_WEIGHTS[slot] for slot in SLOT_NAMES])[:, None]
+CRITICAL_TABLE = _positive & np.isin(SLOT_NAMES, CRITICAL_SLOTS)[:, None]
+
+# slot -> {label: class index}, to score already-serialized predictions
+CLASS_INDEX = {slot: {label: i for i, label in enumerate(labels)} for slot, labels in CLASS_MAPPINGS.items()}
+
+class TriageResults:
+    """Triage for N patients as int arrays
+
+    `scores` holds the weighted symptom totals, and `priorities` and
+    `risk_levels` index PRIORITIES and RISK_LEVELS (0 is the most urgent).
+    """
+    __slots__ = ('scores', 'critical_flags', 'priorities', 'risk_levels')
+
+    def __init__(self, scores, critical_flags):
+        self.scores = scores
+        self.critical_flags = critical_flags
+        self.priorities = np.select([(critical_flags >= 2) | (scores >= 15),
+                                     (critical_flags >= 1) | (scores >= 10),
+                                     scores >= 5], [0, 1, 2], 3)
+        self.risk_levels = np.select([critical_flags >= 2, scores >= 10, scores >= 5], [0, 1, 2], 3)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def ranking(self):
+        """Patient indices, most urgent first (priority, then score, then input order)"""
+        return np.lexsort((-self.scores, self.priorities)).tolist()
+
+    def to_dicts(self):
+        """Per-patient {'priority', 'color', 'score', 'max_score', 'risk_level'} dicts for JSON responses"""
+        return [{'priority': priority, 'color': color, 'score': score, 'max_score': MAX_SCORE,
+                 'risk_level': risk_level}
+                for priority, color, score, risk_level in zip(PRIORITIES[self.priorities].tolist(),
+                                                              PRIORITY_COLORS[self.priorities].tolist(),
+                                                              self.scores.tolist(),
+                                                              RISK_LEVELS[self.risk_levels].tolist())]
+
+def triage(predictions):
+    """TriageResults for a SlotPredictions covering every slot"""
+    if set(predictions.slot_names) != set(SLOT_NAMES):
+        raise ValueError("triage needs predictions for every slot")
+    rows = [SLOT_INDEX[slot] for slot in predictions.slot_names]
+    return TriageResults(SCORE_TABLE[rows, predictions.classes].sum(axis=1),
+                         CRITICAL_TABLE[rows, predictions.classes].sum(axis=1))
+
+def triage_dicts(results):
+    """TriageResults for per-patient {slot: {'prediction': label, ...}} dicts
+
+    Missing slots and unknown labels score nothing, as in the desktop client:
+    class 0 of every slot ('No', 'Short', 'Mild') carries no points.
+    """
+    classes = np.zeros((len(results), len(SLOT_NAMES)), dtype=np.int64)
+    for i, result in enumerate(results):
+        if not isinstance(result, dict):
+            raise ValueError("predictions must be {slot: {\"prediction\": label}} objects")
+        for slot, prediction in result.items():
+            label = prediction.get('prediction') if isinstance(prediction, dict) else None
+            index = CLASS_INDEX.get(slot, {}).get(label)
+            if index is not None:
+                classes[i, SLOT_INDEX[slot]] = index
+    return triage(SlotPredictions(classes, None))